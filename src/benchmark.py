@@ -0,0 +1,212 @@
+import argparse
+import copy
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from src.config import Config
+from src.parallel_population import ParallelPopulation
+from src.population import Population
+from src.synthetic import synthetic_forest, write_forest_csv
+from src.utils import import_data
+from src.vectorized_population import VectorizedPopulation
+
+"""
+Benchmark of the simulation on synthetic populations: every phase of the simulation is timed separately for each
+engine and population size (the yearly update through the population instrumentation), the results are written as
+JSON
+
+    python src/benchmark.py --engines objects vectorized --trees 10000 100000 --years 3 --output benchmark.json
+"""
+
+
+class PhaseTimer:
+    """
+    Accumulate the wall time spent in methods of an object, the methods are wrapped on the instance
+    """
+
+    def __init__(self):
+        self.times = {}
+
+    def wrap(self, obj, method, phase=None):
+        """
+        Time obj.method under the name phase (the method name by default), does nothing if obj has no such method
+        """
+        function = getattr(obj, method, None)
+        if function is None:
+            return
+        phase = phase or method
+
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.times[phase] = self.times.get(phase, 0.0) + time.perf_counter() - start
+
+        setattr(obj, method, timed)
+
+    def pop(self):
+        """
+        Times accumulated since the last call
+        """
+        times, self.times = self.times, {}
+        return times
+
+
+def create_population(config):
+    """
+    Empty population of the engine selected by config.engine
+    """
+    if config.engine == "vectorized":
+        return VectorizedPopulation()
+    if config.engine == "parallel":
+        return ParallelPopulation(workers=config.workers, tiles=config.parallel_tiles)
+    return Population()
+
+
+def benchmark_run(config, n_trees, years, render=False, **forest_parameters):
+    """
+    Simulate years on a synthetic population of n_trees, config.instrumentation should be enabled
+    :return: dict with the time of each phase, at setup and for every year (population at the beginning of the
+             year, its map and its update)
+    """
+    random.seed(config.seed)
+    np.random.seed(config.seed)
+    timer = PhaseTimer()
+
+    start = time.perf_counter()
+    df = synthetic_forest(n_trees, config.bounding_box, seed=config.seed, **forest_parameters)
+    generate = time.perf_counter() - start
+
+    # The forest goes through the csv ingest like the tree inventory, parsed (cold) then read from the cache
+    ingest_config = copy.copy(config)
+    ingest_config.data_path = config.result_path + "data/"
+    ingest_config.data_file = "synthetic_trees.csv"
+    ingest_config.species_mapping_file = "synthetic_mapping.json"
+    if os.path.isdir(ingest_config.data_path):
+        shutil.rmtree(ingest_config.data_path)
+    write_forest_csv(df, ingest_config.data_path, ingest_config.data_file, ingest_config.species_mapping_file)
+    start = time.perf_counter()
+    import_data(ingest_config)
+    ingest_cold = time.perf_counter() - start
+    start = time.perf_counter()
+    df = import_data(ingest_config)
+    ingest_cached = time.perf_counter() - start
+
+    population = create_population(config)
+    timer.wrap(population, "create_trees")
+    timer.wrap(population, "init_spatial_index")
+    timer.wrap(population, "init_statistic")
+    start = time.perf_counter()
+    population.populate(df, config)
+    setup = {"generate": generate, "ingest_cold": ingest_cold, "ingest_cached": ingest_cached,
+             "populate": time.perf_counter() - start, **timer.pop()}
+
+    visualize = None
+    if render:
+        from src.visualisation import Visualisation
+        visualize = Visualisation(config)
+        visualize.set_group_color_mapping(population._tree_groups)
+        timer.wrap(visualize, "write_frame", "animation")
+
+    results = []
+    for year in range(years + 1):
+        phases = {}
+        population_size = len(population._trees_alive)
+        if visualize is not None:
+            start = time.perf_counter()
+            visualize.create_visualisation_step(population, year, config.result_path)
+            phases["render"] = time.perf_counter() - start
+        phases.update(timer.pop())
+        if "render" in phases and "animation" in phases:
+            phases["render"] -= phases["animation"]
+        counters = {}
+        if year < years:
+            start = time.perf_counter()
+            population.update_forest(config, year)
+            phases["update_forest"] = time.perf_counter() - start
+            # Phases and counters of the update, recorded by the population instrumentation
+            for name, value in population._instrumentation.last_year().items():
+                if name.startswith("time_"):
+                    phases[name[len("time_"):]] = value
+                elif name != "year":
+                    counters[name] = value
+        results.append({"year": population._starting_year + year, "population_size": population_size,
+                        "phases": phases, "counters": counters})
+
+    if visualize is not None:
+        start = time.perf_counter()
+        visualize.close()
+        results[-1]["phases"]["animation"] = (results[-1]["phases"].get("animation", 0.0) +
+                                              time.perf_counter() - start)
+    population.close()
+
+    totals = {}
+    for result in results:
+        for phase, seconds in result["phases"].items():
+            totals[phase] = totals.get(phase, 0.0) + seconds
+    return {"engine": config.engine, "n_trees": n_trees, "years": years, "setup": setup, "totals": totals,
+            "per_year": results}
+
+
+def main():
+    """
+    Run the benchmarks given on the command line, the other parameters are read from config.yaml
+    """
+    parser = argparse.ArgumentParser(description="Benchmark the simulation on synthetic populations")
+    parser.add_argument("--engines", nargs="+", default=["objects", "vectorized"],
+                        choices=["objects", "vectorized", "parallel"])
+    parser.add_argument("--trees", nargs="+", type=int, default=[10000, 100000],
+                        help="population sizes of the synthetic forests")
+    parser.add_argument("--years", type=int, default=3, help="simulated years per run")
+    parser.add_argument("--clustered", type=float, default=0.0,
+                        help="proportion of the trees drawn in clusters")
+    parser.add_argument("--age-mean", type=float, default=30)
+    parser.add_argument("--render", action="store_true", help="also time the maps and the animation")
+    parser.add_argument("--result-path", default="../results/benchmark/",
+                        help="directory of the maps, animation and lifecycle log written by the runs")
+    parser.add_argument("--output", default="benchmark.json")
+    args = parser.parse_args()
+
+    config = Config()
+    if "objects" in args.engines and config.mortality == "scheduled":
+        parser.error('mortality "scheduled" (config.yaml) is not supported by the objects engine')
+    config.result_path = args.result_path
+    config.checkpoint_interval = None
+    config.instrumentation = True
+    config.progress_bars = False
+    os.makedirs(config.result_path, exist_ok=True)
+
+    runs = []
+    for engine in args.engines:
+        config.engine = engine
+        for n_trees in args.trees:
+            print(f"\t-- Benchmark {engine} engine, {n_trees} trees")
+            run = benchmark_run(config, n_trees, args.years, render=args.render, clustered=args.clustered,
+                                age_mean=args.age_mean)
+            print(json.dumps(run["totals"], indent=1))
+            runs.append(run)
+
+    report = {
+        "created": datetime.now(timezone.utc).isoformat(),
+        "machine": {"platform": platform.platform(), "processor": platform.processor(), "cpu_count": os.cpu_count(),
+                    "python": platform.python_version(), "numpy": np.__version__},
+        "parameters": vars(args),
+        "runs": runs,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=1)
+
+
+if __name__ == '__main__':
+    main()
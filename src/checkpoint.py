@@ -0,0 +1,121 @@
+import json
+import os
+import random
+import shutil
+
+import numpy as np
+
+from src.lifecycle import LifecycleLog
+from src.population_statistic import PopulationStatistic
+from src.utils import read_columns, write_columns
+
+"""
+Binary checkpoints of a running simulation.
+A checkpoint is a directory holding one .npy file per column (memory-mappable) and a state.json with the scalars
+and the random generators states.
+"""
+
+
+def checkpoint_path(config, year):
+    """
+    Directory of the checkpoint taken at the beginning of the given simulation year
+    """
+    return config.result_path + f"checkpoints/year_{year:04d}/"
+
+
+def save_checkpoint(population, path, year):
+    """
+    Save the full state of the population and of the random generators (random and np.random)
+    :param year: amount of simulated years, the simulation resumes at this year
+    """
+    tmp_path = path.rstrip("/") + ".tmp/"
+    if os.path.isdir(tmp_path):
+        shutil.rmtree(tmp_path)
+
+    write_columns(tmp_path + "trees/", population.trees_columns())
+    write_columns(tmp_path + "statistic/", population._stats.columns())
+    write_columns(tmp_path, {
+        "wind": np.array(population._wind_dir_strength, dtype=np.float64).reshape(-1, 2),
+        "np_random_key": np.random.get_state()[1],
+        "lifecycle_index": np.array(population._lifecycle.index, dtype=np.int64),
+    })
+
+    python_state = random.getstate()
+    _, _, np_pos, np_has_gauss, np_cached_gaussian = np.random.get_state()
+    state = {
+        "engine": type(population).__name__,
+        "year": year,
+        "starting_year": population._starting_year,
+        "current_tree_id": int(population._current_tree_id),
+        "tree_groups": [int(group) for group in population._tree_groups],
+        "lifecycle_path": population._lifecycle.path,
+        "lifecycle_counts": [population._lifecycle.n_births, population._lifecycle.n_deaths],
+        "random_state": [python_state[0], list(python_state[1]), python_state[2]],
+        "np_random_state": [int(np_pos), int(np_has_gauss), float(np_cached_gaussian)],
+    }
+    with open(tmp_path + "state.json", "w") as f:
+        json.dump(state, f)
+
+    # Replace the previous checkpoint of this year only once the new one is complete
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def load_checkpoint(path, config):
+    """
+    Rebuild a population from a checkpoint and restore the random generators
+    :return: (population, year to resume the simulation at)
+    """
+    from src.parallel_population import ParallelPopulation
+    from src.population import Population
+    from src.vectorized_population import VectorizedPopulation
+
+    with open(os.path.join(path, "state.json"), "r") as f:
+        state = json.load(f)
+
+    if state["engine"] == "ParallelPopulation":
+        population = ParallelPopulation(workers=config.workers, tiles=config.parallel_tiles)
+    elif state["engine"] == "VectorizedPopulation":
+        population = VectorizedPopulation()
+    else:
+        population = Population()
+
+    population.species_label_map = config.species_label_map
+    # The wind of the resumed years follows the config, so a run can branch into another wind scenario
+    population._wind_strategy = config.wind_strategy
+    population._starting_year = state["starting_year"]
+    population._current_tree_id = state["current_tree_id"]
+    population._tree_groups = state["tree_groups"]
+    population.init_instrumentation(config)
+    population.restore_trees(read_columns(os.path.join(path, "trees")), config)
+
+    population._stats = PopulationStatistic.from_columns(read_columns(os.path.join(path, "statistic"), mmap_mode=None),
+                                                         population._starting_year, config.simulation_duration)
+    columns = read_columns(path)
+    population._year = population._starting_year + state["year"]
+    population._lifecycle = resume_lifecycle(population._starting_year, state["lifecycle_path"], config,
+                                             columns["lifecycle_index"].tolist())
+    population._lifecycle.n_births, population._lifecycle.n_deaths = state["lifecycle_counts"]
+    population._wind_dir_strength = [tuple(wind) for wind in columns["wind"].tolist()]
+
+    version, internal_state, gauss_next = state["random_state"]
+    random.setstate((version, tuple(internal_state), gauss_next))
+    np_pos, np_has_gauss, np_cached_gaussian = state["np_random_state"]
+    np.random.set_state(("MT19937", np.array(columns["np_random_key"]), np_pos, np_has_gauss, np_cached_gaussian))
+
+    return population, state["year"]
+
+
+def resume_lifecycle(starting_year, source_path, config, index):
+    """
+    Lifecycle log of a resumed simulation in config.result_path/lifecycle/. Resumed in the run of the checkpoint the
+    events logged after the checkpoint are dropped, resumed in another result_path the events up to the checkpoint
+    are copied from the source log, which is not modified. Without a source log only the counts are kept.
+    """
+    path = config.result_path + "lifecycle/"
+    if not config.lifecycle_log or source_path is None:
+        return LifecycleLog(starting_year, None, index=index)
+    if os.path.isdir(path) and os.path.samefile(path, source_path):
+        return LifecycleLog(starting_year, path, index=index)
+    return LifecycleLog.branch(starting_year, source_path, path, index)
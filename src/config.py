@@ -22,6 +22,39 @@ class Config:
         self.data_file = self.__config["data_file"]
         self.result_path = self.__config["result_path"]
         self.wind_strategy = self.__config["wind_strategy"]
+        self.headless = self.__config.get("headless", False)  # statistic only, no map, animation or figure
+        self.engine = self.__config.get("engine", "objects")  # "objects", "vectorized" or "parallel"
+        self.workers = self.__config.get("workers")  # parallel engine, all cores if None
+        self.parallel_tiles = self.__config.get("parallel_tiles")  # parallel engine, [rows, columns] of the tiles
+        self.lifecycle_log = self.__config.get("lifecycle_log", True)  # log births and deaths in result_path/lifecycle/
+        self.height_histogram = self.__config.get("height_histogram", False)  # year x group x height level counts
+        self.checkpoint_interval = self.__config.get("checkpoint_interval")  # years between checkpoints, None to disable
+        self.resume_from = self.__config.get("resume_from")  # checkpoint directory to resume the simulation from
+        self.ensemble_replicates = self.__config.get("ensemble_replicates", 10)
+        self.ensemble_quantiles = self.__config.get("ensemble_quantiles", [0.05, 0.5, 0.95])
+        self.render_workers = self.__config.get("render_workers", 0)  # processes rendering the maps, 0 to render inline
+        self.render_queue = self.__config.get("render_queue")  # frames waiting to be rendered, 2 per worker if None
+        self.animation_format = self.__config.get("animation_format", "gif")  # "gif", "mp4" (imageio-ffmpeg) or None
+        self.save_steps = self.__config.get("save_steps", True)  # also save every map as step_<i>.png
+        self.map_mode = self.__config.get("map_mode", "scatter")  # "scatter" (one dot per tree) or "density" (raster)
+        self.density_resolution = self.__config.get("density_resolution", 500)  # density raster width in pixels
+        self.density_age_shading = self.__config.get("density_age_shading", False)  # darker cells for older trees
+        self.instrumentation = self.__config.get("instrumentation", False)  # per year phase times and counters
+        self.profiler = self.__config.get("profiler")  # "cprofile" to profile the updates, None to disable
+        self.progress_bars = self.__config.get("progress_bars", True)  # progress bars of the yearly update
+        self.verbose = self.__config.get("verbose", True)  # print the initial population and its statistic
+        # "yearly" to draw the survival of every tree every year, "scheduled" to draw the year of death once
+        self.mortality = self.__config.get("mortality", "yearly")
+        self.seed_chunk_size = self.__config.get("seed_chunk_size")  # seeds generated at a time, None for all at once
+        self.habitat_mask = self.__config.get("habitat_mask", False)  # drop the seeds in the Danube or outside Vienna
+        self.habitat_resolution = self.__config.get("habitat_resolution", 10)  # habitat raster cells in meters
+        self.wind_field_file = self.__config.get("wind_field_file")  # wind_strategy "field", .npy file in data_path
+        self.stream_output = self.__config.get("stream_output", True)  # append the statistic of every year to the csv
+        self.snapshots = self.__config.get("snapshots", False)  # save the living trees of every year (stream_output)
+        self.snapshot_compression = self.__config.get("snapshot_compression", True)  # .npz, or .npy to memory-map
+        self.tiles = self.__config.get("tiles", False)  # render every year in a z/x/y tile pyramid (stream_output)
+        self.tile_zoom_levels = self.__config.get("tile_zoom_levels", 6)  # zoom levels 0 to tile_zoom_levels - 1
+        self.tile_size = self.__config.get("tile_size", 256)  # tile side in pixels
         self.tree_size_visualization_max = self.__config["tree_size_visualization_max"]
         self.tree_size_visualization_min = self.__config["tree_size_visualization_min"]
         self.species_label_mapping_file = self.__config["species_label_mapping_file"]
@@ -37,6 +70,9 @@ class Config:
         if self.wind_strategy == "constant":
             self.wind_strength = self.__config["wind_strength"]
             self.wind_direction = self.__config["wind_direction"]
+        if self.engine == "objects" and self.mortality == "scheduled":
+            raise ValueError('mortality "scheduled" needs the vectorized or parallel engine, the objects engine draws '
+                             'the survival of every tree every year')
 
         with open(self.data_path + self.seed_amount_file, "r", encoding="utf-8") as f:
             self.seed_amount_map = json.load(f)
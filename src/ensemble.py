@@ -0,0 +1,120 @@
+import copy
+import os
+import sys
+from multiprocessing import Pool
+from multiprocessing.shared_memory import SharedMemory
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+
+from src.config import Config
+from src.utils import import_data
+from src.vectorized_population import VectorizedPopulation
+
+"""
+Monte Carlo ensemble: run many replicates of the simulation from the same initial population and aggregate their
+yearly statistic
+"""
+
+
+def share_columns(columns):
+    """
+    Copy the columns in shared memory blocks
+    :return: (blocks to close and unlink, {name: (block name, dtype, length)} to attach from the workers)
+    """
+    blocks = []
+    spec = {}
+    for name, column in columns.items():
+        block = SharedMemory(create=True, size=max(column.nbytes, 1))
+        np.ndarray(column.shape, dtype=column.dtype, buffer=block.buf)[:] = column
+        blocks.append(block)
+        spec[name] = (block.name, column.dtype.str, len(column))
+    return blocks, spec
+
+
+def attach_columns(spec):
+    """
+    Private copy of the columns stored in shared memory
+    """
+    columns = {}
+    for name, (block_name, dtype, length) in spec.items():
+        block = SharedMemory(name=block_name)
+        columns[name] = np.ndarray((length,), dtype=dtype, buffer=block.buf).copy()
+        block.close()
+    return columns
+
+
+def run_replicate(replicate, spec, config):
+    """
+    Worker task: run one replicate without visualisation
+    :return: statistic as an array (year x [population_size, groups...])
+    """
+    np.random.seed(np.random.SeedSequence([config.seed, replicate]).generate_state(8))
+    population = VectorizedPopulation()
+    population.populate_from_columns(attach_columns(spec), config)
+    for year in range(config.simulation_duration):
+        population.update_forest(config, year)
+    return population._statistic[['population_size'] + population._tree_groups].to_numpy(dtype=np.float64)
+
+
+def run_ensemble(config, replicates, workers=None):
+    """
+    Run replicates of the simulation in parallel with independent seeds, the initial population is loaded once and
+    shared read-only with the workers
+    :return: DataFrame with, for each year, the mean, standard deviation and quantiles (exact, over the replicates) of
+    the population size and of every group
+    """
+    # The replicates only need their statistic, they do not write a lifecycle log nor print their initial population
+    replicate_config = copy.copy(config)
+    replicate_config.lifecycle_log = False
+    replicate_config.verbose = False
+    population = VectorizedPopulation()
+    population.populate(import_data(config), replicate_config)
+    labels = ['population_size'] + [config.species_label_map.get(group, str(group))
+                                    for group in population._tree_groups]
+    years = population._starting_year + np.arange(config.simulation_duration + 1)
+
+    blocks, spec = share_columns(population.columns())
+    try:
+        with Pool(workers) as pool:
+            tasks = [(replicate, spec, replicate_config) for replicate in range(replicates)]
+            # replicate x year x [population_size, groups...], small enough to keep every replicate
+            statistics = np.stack(pool.map(_run_replicate_star, tasks))
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    tables = {"mean": statistics.mean(axis=0),
+              "std": statistics.std(axis=0, ddof=1) if replicates > 1 else np.zeros(statistics.shape[1:])}
+    for p in config.ensemble_quantiles:
+        tables[f"q{round(p * 100):02d}"] = np.quantile(statistics, p, axis=0)
+    frames = []
+    for name, table in tables.items():
+        frame = pd.DataFrame(table, columns=labels)
+        frame.insert(0, "statistic", name)
+        frame.insert(0, "year", years)
+        frames.append(frame)
+    return pd.concat(frames, ignore_index=True)
+
+
+def _run_replicate_star(args):
+    return run_replicate(*args)
+
+
+def main():
+    """
+    Run an ensemble of simulations, the amount of replicates is read from config.yaml (ensemble_replicates)
+    """
+    config = Config()
+    ensemble = run_ensemble(config, config.ensemble_replicates, workers=config.workers)
+    if not os.path.isdir(config.result_path):
+        os.mkdir(config.result_path)
+    ensemble.to_csv(config.result_path + 'Ensemble_evolution.csv', index=False)
+    print(ensemble)
+
+
+if __name__ == '__main__':
+    main()
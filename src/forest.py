@@ -0,0 +1,176 @@
+import numpy as np
+
+from src.tree import Tree
+
+"""
+Structure of arrays storage for the tree population used by the vectorized engine
+"""
+
+
+class Forest:
+    """
+    Keep every tree attribute in its own numpy column so the yearly update can be done with array operations.
+    Rows are never reordered, a dead tree has its alive flag cleared and its row is reused by the next new trees,
+    so the columns grow with the amount of living trees, not with every tree that ever lived.
+    """
+
+    columns = {
+        "id": np.int64,
+        "north": np.float64,  # meters on the plane of the simulation, see LocalProjection
+        "east": np.float64,
+        "species": np.int64,
+        "age": np.int64,
+        "height_level": np.int64,
+        "spreading_factor": np.float64,
+        "alive": np.bool_,
+    }
+
+    def __init__(self, capacity=1024):
+        self._size = 0
+        self._n_alive = 0
+        self._free = np.empty(0, dtype=np.int64)  # rows of dead trees, reused first-in first-out
+        self._data = {name: np.zeros(capacity, dtype=dtype) for name, dtype in self.columns.items()}
+        self.trees_alive = AliveTrees(self)
+        self.population = None  # population owning the forest, the trees killed through a TreeView die through it
+
+    def __getattr__(self, name):
+        # Expose the used part of each column as forest.<column>
+        data = self.__dict__.get("_data")
+        if data is not None and name in data:
+            return data[name][:self._size]
+        raise AttributeError(name)
+
+    def __len__(self):
+        return self._size
+
+    def __iter__(self):
+        for row in range(self._size):
+            yield TreeView(self, row)
+
+    def __getitem__(self, row):
+        if not 0 <= row < self._size:
+            raise IndexError(row)
+        return TreeView(self, row)
+
+    @property
+    def n_alive(self):
+        return self._n_alive
+
+    @property
+    def free_rows(self):
+        """
+        Rows of dead trees waiting to be reused, in reuse order
+        """
+        return self._free
+
+    @free_rows.setter
+    def free_rows(self, rows):
+        self._free = np.asarray(rows, dtype=np.int64)
+
+    def append(self, id, north, east, species, age, height_level, spreading_factor):
+        """
+        Add trees in the rows of dead trees then at the end of the columns, every argument is an array (or scalar)
+        of the same length
+
+        :return: rows of the new trees
+        """
+        n = len(np.atleast_1d(id))
+        reused, self._free = self._free[:n], self._free[n:]
+        new = n - len(reused)
+        self._reserve(self._size + new)
+        rows = np.concatenate([reused, np.arange(self._size, self._size + new)])
+        values = {"id": id, "north": north, "east": east, "species": species, "age": age,
+                  "height_level": height_level, "spreading_factor": spreading_factor, "alive": True}
+        for name, value in values.items():
+            self._data[name][rows] = value
+        self._size += new
+        self._n_alive += n
+        return rows
+
+    def kill(self, rows):
+        """
+        Mark the trees at the given rows as dead, their rows are freed
+        """
+        rows = rows[self._data["alive"][rows]]
+        self._data["alive"][rows] = False
+        self._free = np.concatenate([self._free, rows])
+        self._n_alive -= len(rows)
+
+    def alive_rows(self):
+        """
+        Return the rows of the living trees
+        """
+        return np.flatnonzero(self._data["alive"][:self._size])
+
+    def _reserve(self, capacity):
+        """
+        Grow the columns geometrically so appending stays amortized O(1)
+        """
+        current = len(self._data["id"])
+        if capacity <= current:
+            return
+        new_capacity = max(capacity, 2 * current)
+        for name, column in self._data.items():
+            grown = np.zeros(new_capacity, dtype=column.dtype)
+            grown[:self._size] = column[:self._size]
+            self._data[name] = grown
+
+
+class AliveTrees:
+    """
+    Iterable view over the living trees of a Forest, stands in for Population._trees_alive
+    """
+
+    def __init__(self, forest):
+        self._forest = forest
+
+    def __len__(self):
+        return self._forest.n_alive
+
+    def __iter__(self):
+        for row in self._forest.alive_rows():
+            yield TreeView(self._forest, row)
+
+
+def _column_property(column, cast):
+    def getter(self):
+        return cast(self._forest._data[column][self._row])
+
+    def setter(self, value):
+        self._forest._data[column][self._row] = value
+
+    return property(getter, setter)
+
+
+class TreeView(Tree):
+    """
+    Tree whose attributes are read from and written to a row of a Forest, so the object API keeps working
+    on top of the vectorized engine
+    """
+
+    def __init__(self, forest, row):
+        self._forest = forest
+        self._row = int(row)
+
+    id = _column_property("id", int)
+    _north = _column_property("north", float)
+    _east = _column_property("east", float)
+    _species = _column_property("species", int)
+    _age = _column_property("age", int)
+    _height_level = _column_property("height_level", int)
+    _spreading_factor = _column_property("spreading_factor", float)
+
+    @property
+    def _alive(self):
+        return bool(self._forest._data["alive"][self._row])
+
+    @_alive.setter
+    def _alive(self, value):
+        # Killed through the population like in the yearly update, so that the tree also leaves the spatial index,
+        # the statistic and the lifecycle log
+        if not value and self._alive:
+            population = self._forest.population
+            if population is None:
+                self._forest.kill(np.array([self._row]))
+            else:
+                population.remove_trees(np.array([self._row]))
@@ -0,0 +1,111 @@
+import hashlib
+import math
+import os
+
+import numpy as np
+
+from src.projection import local_projection
+
+"""
+Habitat mask: the cells of a metric grid over the bounding box where a seed can grow, inside the Vienna boundary and
+outside the Danube. The polygons are rasterized once and the mask is cached as a .npy file, the seeds are then
+filtered with an array lookup.
+"""
+
+_masks = {}  # (data_path, bounding_box, resolution) -> HabitatMask, loaded once per process (also in the workers)
+
+
+def habitat_mask(config):
+    """
+    Habitat mask of the config, rasterized on the first call and cached in data_path/cache/
+    :return: HabitatMask, None if config.habitat_mask is disabled
+    """
+    if not config.habitat_mask:
+        return None
+    mask_key = (config.data_path, repr(config.bounding_box), config.habitat_resolution)
+    if mask_key not in _masks:
+        path = config.data_path + "cache/habitat_" + habitat_key(config) + ".npy"
+        if not os.path.isfile(path):
+            cells = rasterize_habitat(config)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path[:-4] + f".{os.getpid()}.tmp.npy"
+            np.save(tmp_path, cells)
+            os.replace(tmp_path, path)
+        _masks[mask_key] = HabitatMask(np.load(path, mmap_mode='r'), local_projection(config.bounding_box).bounds,
+                                       config.habitat_resolution)
+    return _masks[mask_key]
+
+
+def habitat_files(config):
+    """
+    Vienna boundary and Danube files (the ones drawn by Visualisation)
+    """
+    danube = sorted(file for file in os.listdir(config.data_path) if file.startswith('danube'))
+    return [config.data_path + 'export.geojson'], [config.data_path + file for file in danube]
+
+
+def habitat_key(config):
+    """
+    Hash of everything the mask depends on
+    """
+    key = hashlib.sha256()
+    vienna_files, danube_files = habitat_files(config)
+    for file in vienna_files + danube_files:
+        key.update(os.path.basename(file).encode())
+        with open(file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                key.update(chunk)
+    # "plane": the cells are laid out on the plane of the simulation, the masks cached before are not reused
+    key.update(repr((config.bounding_box, config.habitat_resolution, "plane")).encode())
+    return key.hexdigest()[:16]
+
+
+def rasterize_habitat(config):
+    """
+    Boolean (rows, columns) array, True where the center of the cell is in Vienna and not in the Danube
+    """
+    import geopandas as gpd
+    import shapely
+
+    vienna_files, danube_files = habitat_files(config)
+    vienna = shapely.union_all([gpd.read_file(file).geometry.union_all() for file in vienna_files])
+    danube = shapely.union_all([gpd.read_file(file).geometry.union_all() for file in danube_files])
+    habitat = shapely.difference(vienna, danube)
+    shapely.prepare(habitat)
+
+    projection = local_projection(config.bounding_box)
+    grid = HabitatMask(np.zeros((0, 0), dtype=bool), projection.bounds, config.habitat_resolution)
+    cells = np.zeros(grid.shape, dtype=bool)
+    easts = grid.east_min + (np.arange(grid.shape[1]) + 0.5) * grid.resolution
+    for row in range(grid.shape[0]):
+        north = grid.north_min + (row + 0.5) * grid.resolution
+        lats, longs = projection.to_lat_long(np.full(len(easts), north), easts)
+        cells[row] = shapely.contains_xy(habitat, longs, lats)
+    return cells
+
+
+class HabitatMask:
+    """
+    Boolean raster over the bounding box with square cells of resolution meters on the plane of the simulation
+    """
+
+    def __init__(self, cells, bounds, resolution):
+        """
+        :param bounds: ((south, west), (north, east)) of the bounding box in meters, see LocalProjection.bounds
+        """
+        (self.north_min, self.east_min), (north_max, east_max) = bounds
+        self.resolution = resolution
+        self.shape = (math.ceil((north_max - self.north_min) / resolution),
+                      math.ceil((east_max - self.east_min) / resolution))
+        self.cells = cells
+
+    def habitable(self, north, east):
+        """
+        Boolean array, True where a seed at (north, east) can grow (False outside the raster)
+        """
+        row = np.floor((np.asarray(north) - self.north_min) / self.resolution).astype(np.int64)
+        column = np.floor((np.asarray(east) - self.east_min) / self.resolution).astype(np.int64)
+        inside = (0 <= row) & (row < self.shape[0]) & (0 <= column) & (column < self.shape[1])
+        result = np.zeros(row.shape, dtype=bool)
+        result[inside] = self.cells[row[inside], column[inside]]
+        return result
@@ -0,0 +1,163 @@
+import time
+
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+"""
+Optional instrumentation of the simulation: wall time per phase and counters, recorded once a year
+"""
+
+
+class Instrumentation:
+    """
+    Per year wall time of the phases of the update and counters (seeds generated, dropped, rejected, neighbour
+    queries...). The phases can be nested, the time of a phase excludes the time of the phases inside it so the phases
+    of a year add up to the time of the update.
+    When disabled, phase() returns a shared no-op context manager and count() returns immediately.
+
+    A profiler (any object with enable() and disable(), like cProfile.Profile) is enabled during the updates.
+    """
+
+    def __init__(self, enabled=False, profiler=None):
+        self.enabled = enabled
+        self.profiler = profiler
+        self.counts = {}
+        self._times = {}
+        self._stack = []
+        self._rows = []
+
+    def phase(self, name):
+        """
+        Context manager timing a phase of the update
+        """
+        if not self.enabled:
+            return _NO_PHASE
+        return _Phase(self, name)
+
+    def count(self, name, n=1):
+        """
+        Add n to the counter name
+        """
+        if self.enabled:
+            self.counts[name] = self.counts.get(name, 0) + n
+
+    def merge(self, counts):
+        """
+        Add counters computed elsewhere (in a worker process)
+        """
+        for name, n in counts.items():
+            self.count(name, n)
+
+    def collect_index(self, index):
+        """
+        Count the neighbour queries of a GridIndex since the last collect and reset its counters
+        """
+        self.count("neighbour_queries", index.queries)
+        self.count("candidates_scanned", index.scanned)
+        index.queries = index.scanned = 0
+
+    def start_year(self):
+        if self.profiler is not None:
+            self.profiler.enable()
+
+    def end_year(self, year):
+        """
+        Record the times and counters of the year and reset them
+        """
+        if self.profiler is not None:
+            self.profiler.disable()
+        if not self.enabled:
+            return
+        row = {"year": year}
+        row.update({f"time_{name}": seconds for name, seconds in self._times.items()})
+        row.update(self.counts)
+        if self.counts.get("neighbour_queries"):
+            row["candidates_per_query"] = self.counts["candidates_scanned"] / self.counts["neighbour_queries"]
+        if resource is not None:
+            # Peak resident memory of the process so far (kilobytes on Linux)
+            row["peak_memory_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        self._rows.append(row)
+        self._times = {}
+        self.counts = {}
+
+    def last_year(self):
+        """
+        Row recorded for the last year, {} if none
+        """
+        return self._rows[-1] if self._rows else {}
+
+    def to_frame(self):
+        """
+        One row per year, columns year, time_<phase>, counters, candidates_per_query and peak_memory_mb
+        """
+        return pd.DataFrame(self._rows)
+
+
+class _Phase:
+    def __init__(self, instrumentation, name):
+        self._instrumentation = instrumentation
+        self._name = name
+
+    def __enter__(self):
+        self._instrumentation._stack.append(self._name)
+        self._start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self._start
+        instrumentation = self._instrumentation
+        instrumentation._stack.pop()
+        times = instrumentation._times
+        times[self._name] = times.get(self._name, 0.0) + elapsed
+        if instrumentation._stack:
+            parent = instrumentation._stack[-1]
+            times[parent] = times.get(parent, 0.0) - elapsed
+
+
+class _NoPhase:
+    def __enter__(self):
+        pass
+
+    def __exit__(self, *exc):
+        pass
+
+
+_NO_PHASE = _NoPhase()
+
+
+class ProgressBar:
+    """
+    Optional alive_bar updated at most about 100 times, whatever the amount of items
+    """
+
+    def __init__(self, enabled, total, title):
+        self._enabled = enabled
+        self._total = total
+        self._title = title
+        self._step = max(1, total // 100)
+        self._pending = 0
+
+    def __enter__(self):
+        if self._enabled:
+            from alive_progress import alive_bar
+            self._context = alive_bar(total=self._total, title=self._title, spinner='classic')
+            self._bar = self._context.__enter__()
+        return self
+
+    def __call__(self, n=1):
+        self._pending += n
+        if self._pending >= self._step:
+            self.flush()
+
+    def flush(self):
+        if self._enabled and self._pending:
+            self._bar(self._pending)
+        self._pending = 0
+
+    def __exit__(self, *exc):
+        if self._enabled:
+            self.flush()
+            return self._context.__exit__(*exc)
@@ -0,0 +1,168 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+"""
+Lifecycle log of the trees: births and deaths are stored as fixed-width records in an append-only binary file
+instead of keeping every dead tree in memory
+"""
+
+DEATH = 0
+BIRTH = 1
+
+RECORD = np.dtype([("event", "u1"), ("id", "<i8"), ("year", "<i4"), ("lat", "<f8"), ("long", "<f8"),
+                   ("species", "<i2")])
+
+
+class LifecycleLog:
+    """
+    Append-only log of the birth and death events.
+    The events of a simulation year are buffered and written at the end of the year, the file index.npy keeps the
+    amount of records written at the end of each year so the file can be cut at any past year. The events file can be
+    memory-mapped with numpy.memmap(path + "events.bin", dtype=RECORD).
+    Without a path only the amount of births and deaths is kept.
+    """
+
+    def __init__(self, starting_year, path=None, index=None):
+        """
+        :param path: directory of the log, None to only count the events
+        :param index: amount of records at the end of each year, to resume an existing log (the events written
+                      after the last year of the index are dropped)
+        """
+        self.starting_year = starting_year
+        self.path = path
+        self._buffer = []
+        self._index = list(index) if index is not None else []
+        self.n_births = 0
+        self.n_deaths = 0
+        self._file = None  # events file, open for appending until close
+
+        if path is not None:
+            os.makedirs(path, exist_ok=True)
+            records = self._index[-1] if self._index else 0
+            self._file = open(self._events_file, "ab")
+            self._file.truncate(records * RECORD.itemsize)
+            if records:
+                events = self.events()["event"]
+                self.n_births = int(np.count_nonzero(events == BIRTH))
+                self.n_deaths = records - self.n_births
+
+    @classmethod
+    def branch(cls, starting_year, source_path, path, index):
+        """
+        Log of a simulation resumed from a checkpoint of another run: the events of the source log up to the
+        checkpoint are copied in path, the source log is left untouched
+        :param index: amount of records at the end of each year up to the checkpoint
+        """
+        os.makedirs(path, exist_ok=True)
+        records = index[-1] if index else 0
+        with open(os.path.join(source_path, "events.bin"), "rb") as source, \
+                open(os.path.join(path, "events.bin"), "wb") as destination:
+            left = records * RECORD.itemsize
+            while left:
+                chunk = source.read(min(left, 1 << 24))
+                if not chunk:
+                    raise ValueError(f"The lifecycle log {source_path} is shorter than the checkpoint")
+                destination.write(chunk)
+                left -= len(chunk)
+        np.save(os.path.join(path, "index.npy"), np.array(index, dtype=np.int64))
+        return cls(starting_year, path, index=index)
+
+    def close(self):
+        """
+        Close the events file, the events of an unfinished year are not written
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def _events_file(self):
+        return os.path.join(self.path, "events.bin")
+
+    @property
+    def index(self):
+        return list(self._index)
+
+    def births(self, year, ids, lats, longs, species):
+        """
+        Record the birth of trees (scalars or arrays)
+        """
+        self.n_births += self._add(BIRTH, year, ids, lats, longs, species)
+
+    def deaths(self, year, ids, lats, longs, species):
+        """
+        Record the death of trees (scalars or arrays)
+        """
+        self.n_deaths += self._add(DEATH, year, ids, lats, longs, species)
+
+    def _add(self, event, year, ids, lats, longs, species):
+        ids = np.atleast_1d(ids)
+        records = np.empty(len(ids), dtype=RECORD)
+        records["event"] = event
+        records["id"] = ids
+        records["year"] = year
+        records["lat"] = lats
+        records["long"] = longs
+        records["species"] = species
+        if self.path is not None:
+            self._buffer.append(records)
+        return len(records)
+
+    def end_year(self):
+        """
+        Write the events of the year to the file and index them
+        """
+        if self.path is None:
+            return
+        records = self._index[-1] if self._index else 0
+        if self._buffer:
+            events = np.concatenate(self._buffer)
+            events.tofile(self._file)
+            self._file.flush()
+            records += len(events)
+            self._buffer = []
+        self._index.append(records)
+        np.save(os.path.join(self.path, "index.npy"), np.array(self._index, dtype=np.int64))
+
+    def events(self):
+        """
+        Memory-mapped array of the written events
+        """
+        records = self._index[-1] if self._index else 0
+        if records == 0:
+            return np.empty(0, dtype=RECORD)
+        return np.memmap(self._events_file, dtype=RECORD, mode="r", shape=(records,))
+
+    def population_at(self, year):
+        """
+        Rebuild the trees alive at the end of a past simulation year from the events
+        :return: DataFrame with the columns id, lat, long, species and age
+        """
+        if self.path is None:
+            raise ValueError("The lifecycle log is disabled (lifecycle_log: false), past populations can not be "
+                             "rebuilt")
+        events = self.events()[:self._index[year - self.starting_year]]
+        births = events[events["event"] == BIRTH]
+        dead = events["id"][events["event"] == DEATH]
+        alive = births[~np.isin(births["id"], dead)]
+        return pd.DataFrame({"id": alive["id"], "lat": alive["lat"], "long": alive["long"],
+                             "species": alive["species"].astype(np.int64), "age": year - alive["year"]})
+
+    def find(self, id):
+        """
+        Birth record of a tree, None if it is unknown
+        """
+        events = self.events()
+        births = np.flatnonzero((events["id"] == id) & (events["event"] == BIRTH))
+        return events[births[0]] if len(births) else None
+
+    def find_death(self, id):
+        """
+        Death record of a tree, None if it is alive, unknown or died during the year not written yet
+        """
+        events = self.events()
+        deaths = np.flatnonzero((events["id"] == id) & (events["event"] == DEATH))
+        return events[deaths[0]] if len(deaths) else None
+
@@ -1,11 +1,64 @@
+import argparse
 import os
+import random
 import sys
 
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+import numpy as np
+
+from src.checkpoint import load_checkpoint
 from src.config import Config
-from src.population import *
-from src.visualisation import *
+from src.parallel_population import ParallelPopulation
+from src.population import Population
+from src.utils import import_data, run_simulation
+from src.vectorized_population import VectorizedPopulation
+
+
+def argument_parser():
+    """
+    Command line overrides of config.yaml, for batch jobs
+    """
+    parser = argparse.ArgumentParser(description="Run a tree propagation simulation")
+    parser.add_argument("--headless", action="store_true", default=None,
+                        help="only save the statistic, no map, animation or figure (the plotting libraries are "
+                             "not imported)")
+    parser.add_argument("--duration", type=int, help="simulated years")
+    parser.add_argument("--seed", type=int)
+    parser.add_argument("--engine", choices=["objects", "vectorized", "parallel"])
+    parser.add_argument("--wind-strategy", choices=["random", "constant", "field"],
+                        help="a wind direction or strength implies constant, constant needs both (from config.yaml "
+                             "or the command line)")
+    parser.add_argument("--wind-direction", type=float, help="constant wind direction in degrees")
+    parser.add_argument("--wind-strength", type=float, help="constant wind strength")
+    parser.add_argument("--result-path")
+    return parser
+
+
+def apply_arguments(config, args, parser):
+    """
+    Override the config with the command line arguments given, exit with a usage error if the constant wind
+    strategy ends up without a wind direction or strength, the field strategy without a wind field file, or the
+    objects engine with the scheduled mortality
+    """
+    overrides = {"headless": args.headless, "simulation_duration": args.duration, "seed": args.seed,
+                 "engine": args.engine, "wind_strategy": args.wind_strategy, "result_path": args.result_path}
+    if args.wind_direction is not None or args.wind_strength is not None:
+        overrides["wind_strategy"] = args.wind_strategy or "constant"
+        overrides["wind_direction"] = args.wind_direction
+        overrides["wind_strength"] = args.wind_strength
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(config, name, value)
+    if config.engine == "objects" and config.mortality == "scheduled":
+        parser.error('mortality "scheduled" (config.yaml) needs --engine vectorized or parallel')
+    if config.wind_strategy == "constant":
+        missing = [name for name in ["wind_direction", "wind_strength"] if getattr(config, name, None) is None]
+        if missing:
+            parser.error("the constant wind strategy needs " + " and ".join(
+                "--" + name.replace("_", "-") for name in missing) + " (or the config.yaml keys)")
+    if config.wind_strategy == "field" and not config.wind_field_file:
+        parser.error("the field wind strategy needs the wind_field_file config.yaml key")
 
 
 def main():
@@ -14,24 +67,46 @@ def main():
     """
     print("\t-- Loading config...\n")
     config = Config()
+    parser = argument_parser()
+    apply_arguments(config, parser.parse_args(), parser)
     random.seed(config.seed)
+    np.random.seed(config.seed)
+    if not os.path.isdir(config.result_path):
+        os.makedirs(config.result_path)
 
-    # Data basic stat
-    data = import_data(config)
+    start_year = 0
+    if config.resume_from:
+        # Restore the population and the random generators from a checkpoint
+        population, start_year = load_checkpoint(config.resume_from, config)
+    else:
+        # Data basic stat
+        data = import_data(config)
 
-    # Create population
-    population = Population()
-    population.populate(data, config)
-    visualize = Visualisation(config)
-    visualize.set_group_color_mapping(population._tree_groups)
+        # Create population
+        if config.engine == "vectorized":
+            population = VectorizedPopulation()
+        elif config.engine == "parallel":
+            population = ParallelPopulation(workers=config.workers, tiles=config.parallel_tiles)
+        else:
+            population = Population()
+        population.populate(data, config)
+
+    visualize = None
+    if not config.headless:
+        from src.visualisation import Visualisation  # Plotting libraries are only imported with visualisation
+        visualize = Visualisation(config)
+        visualize.set_group_color_mapping(population._tree_groups)
     print(population)
 
     print("\n\t-- Simulation ready.")
 
-    run_simulation(population, config, visualize)
-
-    visualize.make_gif(img_path=config.result_path, output_path=config.result_path + "gif/")
-    population.plot_statistic(config)
+    run_simulation(population, config, visualize, start_year=start_year)
+    population.close()
+    if visualize is not None:
+        visualize.close()  # Also finishes the animation
+        population.plot_statistic(config)
+    else:
+        population.save_statistic(config)
     print(population)
 
 
@@ -0,0 +1,84 @@
+import numpy as np
+
+from src.tree import Tree
+
+"""
+Scheduled mortality: the year of death of a tree is drawn once, when it is born or loaded, instead of drawing its
+survival every year
+"""
+
+
+class DeathSchedule:
+    """
+    Year of death of the living trees, kept in buckets by year so the deaths of a year are one lookup.
+    The age of death follows the yearly model: a tree of age a survives the update to age a + 1 with probability
+    Tree.survival_probability(a + 1), so with u uniform in (0, 1] it dies at the first age d > a where
+    sum(log(survival_probability(k)) for a < k <= d) < log(u).
+    """
+
+    def __init__(self):
+        self._buckets = {}  # year -> list of arrays of keys
+        self._log_survival = np.zeros(1)  # log_survival[a] = sum(log(survival_probability(k)) for 0 < k <= a)
+
+    def add(self, keys, year, ages, random_state=np.random):
+        """
+        Draw the year of death of trees of the given ages in the given year
+        :param keys: rows (or ids) of the trees, returned by pop in their year of death
+        :param random_state: np.random or a numpy Generator
+        """
+        keys = np.asarray(keys)
+        ages = np.asarray(ages, dtype=np.int64)
+        if len(keys) == 0:
+            return
+        death_ages = self.sample_death_ages(ages, 1 - random_state.random(len(keys)))
+        years = year + death_ages - ages
+        order = np.argsort(years, kind="stable")
+        years, keys = years[order], keys[order]
+        starts = np.flatnonzero(np.r_[True, np.diff(years) != 0])
+        for start, end in zip(starts, np.r_[starts[1:], len(years)]):
+            self._buckets.setdefault(int(years[start]), []).append(keys[start:end])
+
+    def sample_death_ages(self, ages, u):
+        """
+        Age of death of trees of the given ages, by inversion of their survival function
+        :param u: uniform draws in (0, 1]
+        """
+        target = np.log(u)
+        while True:
+            if ages.max() >= len(self._log_survival):
+                self._grow()
+            target_log_survival = self._log_survival[ages] + target
+            # The log survival decreases with the age, find the first age below the target
+            death_ages = np.searchsorted(-self._log_survival, -target_log_survival, side="right")
+            if death_ages.max() < len(self._log_survival):
+                return death_ages
+            self._grow()
+
+    def _grow(self):
+        size = 2 * max(len(self._log_survival), 256)
+        log_survival = np.log(Tree.survival_probability(np.arange(1, size)))
+        self._log_survival = np.r_[0.0, np.cumsum(log_survival)]
+
+    def pop(self, year):
+        """
+        Keys of the trees dying in the given year, removed from the schedule
+        """
+        bucket = self._buckets.pop(year, [])
+        return np.concatenate(bucket) if bucket else np.empty(0, dtype=np.int64)
+
+    def columns(self):
+        """
+        The schedule as (keys, years) arrays (used by the checkpoints)
+        """
+        keys = [np.concatenate(bucket) for bucket in self._buckets.values()]
+        years = [np.full(len(k), year, dtype=np.int64) for year, k in zip(self._buckets, keys)]
+        return {"scheduled_keys": np.concatenate(keys) if keys else np.empty(0, dtype=np.int64),
+                "scheduled_years": np.concatenate(years) if years else np.empty(0, dtype=np.int64)}
+
+    @classmethod
+    def from_columns(cls, columns):
+        schedule = cls()
+        keys, years = np.asarray(columns["scheduled_keys"]), np.asarray(columns["scheduled_years"])
+        for year in np.unique(years).tolist():
+            schedule._buckets[year] = [keys[years == year]]
+        return schedule
@@ -0,0 +1,123 @@
+import os
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.tiles import TilePyramid
+from src.utils import read_columns, write_columns
+
+"""
+Yearly outputs written while the simulation runs: the statistic row of every year appended to the csv and optional
+snapshots of the living trees and tiled maps
+"""
+
+SNAPSHOT_COLUMNS = ["id", "lat", "long", "species", "age", "height_level"]
+
+
+class YearlyOutput:
+    """
+    Appends the statistic of every year to result_path/Population_evolution.csv as soon as it is recorded (so a
+    crashed run keeps its past years) and, with config.snapshots, saves the living trees of every year in
+    result_path/snapshots/, one snapshot per year (see load_snapshot):
+        -   year_<year>.npz, compressed, with config.snapshot_compression
+        -   year_<year>/<column>.npy otherwise, every column can be memory-mapped
+    With config.tiles every year is also rendered in the tile pyramid of result_path/tiles/ (see TilePyramid).
+    The snapshots and the tiles are written by a background thread, at most 2 years wait to be written.
+    """
+
+    def __init__(self, config):
+        self.species_label_map = config.species_label_map
+        self.statistic_path = config.result_path + 'Population_evolution.csv'
+        self.snapshot_path = config.result_path + 'snapshots/' if config.snapshots else None
+        self.compression = config.snapshot_compression
+        self._config = config if config.tiles else None
+        self._tiles = None
+        self._executor = None
+        self._pending = deque()
+        self._rows = 0
+        os.makedirs(config.result_path, exist_ok=True)
+        if self.snapshot_path is not None:
+            os.makedirs(self.snapshot_path, exist_ok=True)
+        if self.snapshot_path is not None or config.tiles:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+
+    def start(self, population):
+        """
+        Write the statistic recorded so far (one row, or all the years before a checkpoint) and the current trees
+        """
+        statistic = population._statistic.rename(columns=self.species_label_map)
+        statistic.to_csv(self.statistic_path, index=False)
+        self._rows = len(statistic)
+        if self._config is not None:
+            self._tiles = TilePyramid(self._config, population._tree_groups)
+        self.snapshot(population)
+
+    def write_year(self, population):
+        """
+        Append the statistic rows recorded since the last call and save the trees of the year
+        """
+        statistic = population._statistic.rename(columns=self.species_label_map)
+        with open(self.statistic_path, 'a', newline='') as f:
+            statistic.iloc[self._rows:].to_csv(f, index=False, header=False)
+        self._rows = len(statistic)
+        self.snapshot(population)
+
+    def snapshot(self, population):
+        """
+        Queue the snapshot and the tiles of the living trees in their current year
+        """
+        if self._executor is None:
+            return
+        while len(self._pending) >= 2:
+            self._pending.popleft().result()
+        columns = population.columns()
+        snapshot = {name: columns[name] for name in SNAPSHOT_COLUMNS}
+        self._pending.append(self._executor.submit(self.write_snapshot, population._year, snapshot))
+
+    def write_snapshot(self, year, snapshot):
+        """
+        Background task: save the snapshot and render the tiles of a year
+        """
+        if self.snapshot_path is not None:
+            save_snapshot(self.snapshot_path, year, snapshot, self.compression)
+        if self._tiles is not None:
+            self._tiles.render_year(year, snapshot)
+
+    def close(self):
+        """
+        Wait for the snapshots being written
+        """
+        while self._pending:
+            self._pending.popleft().result()
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+
+def save_snapshot(path, year, columns, compression):
+    """
+    Save the columns of the trees of a year, written under a temporary name then renamed
+    """
+    if compression:
+        tmp_file = path + f"year_{year:04d}.tmp.npz"
+        np.savez_compressed(tmp_file, **columns)
+        os.replace(tmp_file, path + f"year_{year:04d}.npz")
+    else:
+        tmp_path = path + f"year_{year:04d}.tmp/"
+        write_columns(tmp_path, columns)
+        if os.path.isdir(path + f"year_{year:04d}/"):  # Written before the checkpoint a run was resumed from
+            shutil.rmtree(path + f"year_{year:04d}/")
+        os.rename(tmp_path, path + f"year_{year:04d}/")
+
+
+def load_snapshot(path, year):
+    """
+    Living trees of a year from the snapshots directory of a run, memory-mapped when not compressed
+    :return: {column: array}
+    """
+    if os.path.isfile(path + f"year_{year:04d}.npz"):
+        with np.load(path + f"year_{year:04d}.npz") as snapshot:
+            return {name: snapshot[name] for name in snapshot.files}
+    return read_columns(path + f"year_{year:04d}/")
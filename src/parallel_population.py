@@ -0,0 +1,246 @@
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.habitat import habitat_mask
+from src.instrumentation import Instrumentation
+from src.projection import local_projection
+from src.seeding import disperse_seeds, select_germinating_seeds
+from src.spatial_index import GridIndex
+from src.tree import Tree
+from src.utils import *
+from src.vectorized_population import VectorizedPopulation
+
+
+class ParallelPopulation(VectorizedPopulation):
+    """
+    Vectorized population updated on several cores by spatial domain decomposition.
+    The bounding box is split in tiles, every year:
+        -   each tile ages its trees, evaluates their mortality and generates their seeds (in a worker process)
+        -   the seeds are sent to the tile they fell in
+        -   each tile plants its seeds against the living trees of the tile and of a halo around it (in a worker)
+        -   seeds accepted by two tiles too close to each other across a border are reconciled in tile order
+    Each tile draws from its own random stream derived from (config.seed, year, tile), so a run is bit-reproducible
+    for a given seed and tile layout, whatever the scheduling of the workers.
+    """
+
+    def __init__(self, workers=None, tiles=None):
+        """
+        :param workers: amount of worker processes, all the cores by default
+        :param tiles: (rows, columns) of the tile grid, derived from the amount of workers by default
+        """
+        super().__init__()
+        self._workers = workers or os.cpu_count()
+        self._tiles = tiles or tile_layout(self._workers)
+        self._executor = None
+
+    def close(self):
+        """
+        Stop the worker processes and close the lifecycle log
+        """
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        super().close()
+
+    def update_forest(self, config, year):
+        """
+        Main loop for population update, run tile by tile in the worker processes
+        """
+        if self._executor is None:
+            habitat_mask(config)  # Rasterized once here, the workers load the cached mask
+            self._executor = ProcessPoolExecutor(max_workers=self._workers)
+        self._year = self._starting_year + year + 1
+        instrumentation = self._instrumentation
+        instrumentation.start_year()
+        wind_direction, wind_strength = self.draw_wind(config)
+        tiles = TileGrid(local_projection(config.bounding_box).bounds, self._tiles)
+        halo = config.seed_living_space + max(spreading_factor_map.values())
+        forest = self._trees
+
+        # Tree update and seeding
+        with instrumentation.phase("tree_update"):
+            rows = forest.alive_rows()
+            forest.age[rows] += 1
+            tile_of_tree = tiles.tile_of(forest.north[rows], forest.east[rows])
+            tile_rows = [rows[tile_of_tree == tile] for tile in range(tiles.n_tiles)]
+            tile_winds = [self.tree_wind(config, forest.north[r], forest.east[r], wind_direction, wind_strength)
+                          for r in tile_rows]
+            if self._death_schedule is None:
+                tile_alive = [None] * tiles.n_tiles  # Drawn in the workers
+            else:
+                dead = self._death_schedule.pop(self._year)
+                tile_alive = [~np.isin(r, dead) for r in tile_rows]
+            updates = self._executor.map(update_tile,
+                                         [(config.seed, year, tile) for tile in range(tiles.n_tiles)],
+                                         [forest.age[r] for r in tile_rows],
+                                         [forest.north[r] for r in tile_rows],
+                                         [forest.east[r] for r in tile_rows],
+                                         [forest.species[r] for r in tile_rows],
+                                         [forest.spreading_factor[r] for r in tile_rows],
+                                         [wind[0] for wind in tile_winds],
+                                         [wind[1] for wind in tile_winds],
+                                         [config] * tiles.n_tiles,
+                                         tile_alive)
+            seeds = []
+            for r, (height_level, alive, tile_seeds, counts) in zip(tile_rows, updates):
+                forest.height_level[r] = height_level
+                self.remove_trees(r[~alive])  # A dead tree can not be replace the year of its death
+                seeds.append(tile_seeds)
+                instrumentation.merge(counts)
+            seeds_north, seeds_east, seeds_species = (np.concatenate(column) for column in zip(*seeds))
+            rows = forest.alive_rows()
+            self._stats.count_heights(forest.species[rows], forest.height_level[rows])
+
+        with instrumentation.phase("planting"):
+            self.plant_tiles(config, year, tiles, halo, rows, seeds_north, seeds_east, seeds_species)
+        self.update_trees_statistics((wind_direction, wind_strength))
+
+    def plant_tiles(self, config, year, tiles, halo, rows, seeds_north, seeds_east, seeds_species):
+        """
+        Plant the seeds in the worker processes, rows are the rows of the living trees
+        """
+        forest = self._trees
+        # Planting, every seed is handled by the tile it fell in
+        tile_of_seed = tiles.tile_of(seeds_north, seeds_east)
+        tile_seeds = [np.flatnonzero(tile_of_seed == tile) for tile in range(tiles.n_tiles)]
+        tile_neighbours = [rows[tiles.in_tile(forest.north[rows], forest.east[rows], tile, halo)]
+                           for tile in range(tiles.n_tiles)]
+        plantings = self._executor.map(plant_tile,
+                                       [(config.seed, year, tile) for tile in range(tiles.n_tiles)],
+                                       [seeds_north[s] for s in tile_seeds],
+                                       [seeds_east[s] for s in tile_seeds],
+                                       [seeds_species[s] for s in tile_seeds],
+                                       [forest.north[r] for r in tile_neighbours],
+                                       [forest.east[r] for r in tile_neighbours],
+                                       [config] * tiles.n_tiles)
+        planted = []
+        for s, (accepted, counts) in zip(tile_seeds, plantings):
+            planted.append(s[accepted])
+            self._instrumentation.merge(counts)
+        with self._instrumentation.phase("border_reconciliation"):
+            planted = reconcile_borders(planted, tile_of_seed, seeds_north, seeds_east, seeds_species, tiles, halo,
+                                        config)
+
+        self.add_new_trees(seeds_north[planted], seeds_east[planted], seeds_species[planted])
+
+
+def tile_layout(workers):
+    """
+    Tile grid (rows, columns) as square as possible with one tile per worker
+    """
+    rows = int(math.sqrt(workers))
+    while workers % rows:
+        rows -= 1
+    return rows, workers // rows
+
+
+class TileGrid:
+    """
+    Regular split of the bounding box in rows x columns tiles, on the plane of the simulation
+    """
+
+    def __init__(self, bounds, layout):
+        """
+        :param bounds: ((south, west), (north, east)) of the bounding box in meters, see LocalProjection.bounds
+        """
+        self.bounding_box = bounds
+        self.rows, self.columns = layout
+        self.n_tiles = self.rows * self.columns
+        self._tile_height = (bounds[1][0] - bounds[0][0]) / self.rows
+        self._tile_width = (bounds[1][1] - bounds[0][1]) / self.columns
+
+    def tile_of(self, north, east):
+        """
+        Index of the tile containing each position
+        """
+        row = np.clip(((north - self.bounding_box[0][0]) // self._tile_height).astype(np.int64), 0, self.rows - 1)
+        column = np.clip(((east - self.bounding_box[0][1]) // self._tile_width).astype(np.int64), 0,
+                         self.columns - 1)
+        return row * self.columns + column
+
+    def bounds(self, tile):
+        """
+        (south, west, north, east) edges of a tile
+        """
+        row, column = divmod(tile, self.columns)
+        south = self.bounding_box[0][0] + row * self._tile_height
+        west = self.bounding_box[0][1] + column * self._tile_width
+        return south, west, south + self._tile_height, west + self._tile_width
+
+    def in_tile(self, north, east, tile, margin=0):
+        """
+        Mask of the positions inside the tile extended by margin meters
+        """
+        south, west, north_edge, east_edge = self.bounds(tile)
+        return ((south - margin <= north) & (north <= north_edge + margin) &
+                (west - margin <= east) & (east <= east_edge + margin))
+
+    def near_border(self, north, east, tile, margin):
+        """
+        Mask of the positions of a tile closer than margin meters to one of its borders
+        """
+        south, west, north_edge, east_edge = self.bounds(tile)
+        return ((north - south < margin) | (north_edge - north < margin) |
+                (east - west < margin) | (east_edge - east < margin))
+
+
+def update_tile(stream, ages, north, east, species, spreading_factor, wind_direction, wind_strength, config,
+                alive=None):
+    """
+    Worker task: height level, mortality and seeds of the (already aged) trees of a tile
+    :param stream: (seed, year, tile) identifying the random stream of the tile
+    :param wind_direction, wind_strength: scalars, or one value per tree with the wind field
+    :param alive: alive mask of the trees when their mortality is scheduled, drawn here otherwise
+    :return: (height levels, alive mask, (north, east, species) of the seeds, instrumentation counters)
+    """
+    rng = np.random.default_rng(list(stream) + [0])
+    instrumentation = Instrumentation(enabled=True)
+    height_level = Tree.compute_height_level(ages)
+    if alive is None:
+        alive = rng.random(len(ages)) < Tree.survival_probability(ages)
+    if np.ndim(wind_direction):  # Wind field, one wind per tree
+        wind_direction, wind_strength = wind_direction[alive], wind_strength[alive]
+    seeds = disperse_seeds(north[alive], east[alive], species[alive], height_level[alive], spreading_factor[alive],
+                           wind_direction, wind_strength, config, rng=rng, instrumentation=instrumentation)
+    return height_level, alive, seeds, instrumentation.counts
+
+
+def plant_tile(stream, seeds_north, seeds_east, seeds_species, trees_north, trees_east, config):
+    """
+    Worker task: select the germinating seeds of a tile against the living trees of the tile and its halo
+    :return: (indices of the germinating seeds in acceptance order, instrumentation counters)
+    """
+    rng = np.random.default_rng(list(stream) + [1])
+    instrumentation = Instrumentation(enabled=True)
+    trees_index = GridIndex(config.seed_living_space + max(spreading_factor_map.values()))
+    trees_index.insert_many(range(len(trees_north)), trees_north, trees_east)
+    accepted = select_germinating_seeds(seeds_north, seeds_east, seeds_species, trees_index, config, rng=rng,
+                                        instrumentation=instrumentation)
+    instrumentation.collect_index(trees_index)
+    return accepted, instrumentation.counts
+
+
+def reconcile_borders(planted, tile_of_seed, seeds_north, seeds_east, seeds_species, tiles, halo, config):
+    """
+    Two tiles may both accept seeds closer to each other than their living space across a border.
+    The seeds close to a border are checked in tile order, then acceptance order: a seed is dropped if a seed kept
+    before it, in another tile, is too close. The result does not depend on the scheduling of the workers.
+
+    :param planted: per tile, indices of the accepted seeds in acceptance order
+    :return: indices of the seeds to plant
+    """
+    radii = config.seed_living_space + get_spreading_factors_from_species(seeds_species)
+    kept_border_seeds = GridIndex(halo)
+    kept = []
+    for tile, accepted in enumerate(planted):
+        border = tiles.near_border(seeds_north[accepted], seeds_east[accepted], tile, halo)
+        for i, on_border in zip(accepted.tolist(), border.tolist()):
+            if on_border:
+                if kept_border_seeds.any_within(seeds_north[i], seeds_east[i], radii[i]):
+                    continue
+                kept_border_seeds.insert(i, seeds_north[i], seeds_east[i])
+            kept.append(i)
+    return np.array(kept, dtype=np.int64)
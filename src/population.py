@@ -1,13 +1,19 @@
-import random
-import sys
+import cProfile
+import itertools
 
-import matplotlib.pyplot as plt
 import numpy as np
-from alive_progress import alive_bar
 from sortedcontainers import SortedKeyList
 
+from src.instrumentation import Instrumentation, ProgressBar
+from src.lifecycle import LifecycleLog
+from src.population_statistic import PopulationStatistic
+from src.projection import local_projection
+from src.seeding import (germinate_seed_chunks, seed_amount_per_height_level, seed_chunks, seeds_to_arrays,
+                         select_germinating_seeds)
+from src.spatial_index import GridIndex
 from src.tree import Tree
 from src.utils import *
+from src.wind import wind_field
 
 
 class Population:
@@ -16,27 +22,45 @@ class Population:
     """
 
     def __init__(self):
-        self._trees = []
-        self._trees_alive = SortedKeyList([], key=lambda t: (t._lat, t._long))
+        self._trees_alive = SortedKeyList([], key=lambda t: (t._north, t._east))
+        self._projection = None  # LocalProjection of the bounding box, the trees are located in meters
+        self._spatial_index = None
+        self._lifecycle = None  # births and deaths, the dead trees are not kept in memory
         self.species_label_map = None
 
         self._tree_groups = None
-        self._statistic = None
+        self._stats = None
+        self._instrumentation = Instrumentation()  # disabled until init_instrumentation
         self._wind_dir_strength = []
         self._wind_strategy = None
         self._starting_year = 2024
+        self._year = self._starting_year  # year of the births and deaths currently happening
         self._current_tree_id = 168880  # extract max id from initial df
 
+    @property
+    def _statistic(self):
+        """
+        Population statistic as a DataFrame (year, population_size, one column per group)
+        """
+        return self._stats.to_frame()
+
     def __repr__(self):
         stat_to_print = self._statistic.rename(columns=self.species_label_map)
         return (f"Population: " +
                 f"\n\t- Started in year {self._starting_year}" +
                 f"\n\t- Wind strategy {self._wind_strategy}" +
-                f"\n\t- {len(self._trees)} trees in total" +
-                f"\n\t- {len(self._trees) - len(self._trees_alive)} trees dead" +
+                f"\n\t- {self._lifecycle.n_births} trees in total" +
+                f"\n\t- {self._lifecycle.n_deaths} trees dead" +
                 f"\n\n\t- Population statistic\n{stat_to_print}" +
                 f"\n\t- Wind values (direction, strength) {self._wind_dir_strength}")
 
+    def close(self):
+        """
+        Release the resources held by the population (worker processes, open files)
+        """
+        if self._lifecycle is not None:
+            self._lifecycle.close()
+
     def plot_statistic(self, config):
         """
         Print and save figures
@@ -49,21 +73,37 @@ class Population:
                                         show_plot_on_the_fly=config.show_plot_on_the_fly)
         self.plot_proportional_group_over_time(config.species_label_map, config.result_path,
                                                show_plot_on_the_fly=config.show_plot_on_the_fly)
+        self.save_statistic(config)
+
+    def save_statistic(self, config):
+        """
+        Save the log and the statistic as csv, without any figure (used alone in headless mode)
 
+        :param config: config object
+        """
         # Save the logs in csv
         with open(config.result_path + 'log.txt', 'w') as file:
-            sys.stdout = file  # Redirect standard output to the file
-            print(self)
-            sys.stdout = sys.__stdout__
+            print(self, file=file)
 
         # save stat as csv
         stat_to_print = self._statistic.rename(columns=self.species_label_map)
         stat_to_print.to_csv(config.result_path + 'Population_evolution.csv', index=False)
+        if self._stats.height_histogram_enabled:
+            height_structure = self._stats.height_histogram_frame()
+            height_structure['group'] = height_structure['group'].map(self.species_label_map)
+            height_structure.to_csv(config.result_path + 'Population_height_structure.csv', index=False)
+        if self._instrumentation.enabled:
+            self._instrumentation.to_frame().to_csv(config.result_path + 'Population_instrumentation.csv',
+                                                    index=False)
+        if isinstance(self._instrumentation.profiler, cProfile.Profile):
+            self._instrumentation.profiler.dump_stats(config.result_path + 'profile.prof')
 
     def plot_proportional_group_over_time(self, species_label_map, save_path, show_plot_on_the_fly):
         """
         Plot proportional graph showing the proportion of each species in the population over time
         """
+        import matplotlib.pyplot as plt  # Only imported when plotting
+
         fig, ax = plt.subplots(figsize=(10, 6))
         stat = self._statistic.copy()
         year = stat["year"].values
@@ -90,6 +130,8 @@ class Population:
         """
         Plot cumulative graph showing the amount of each species in the population over time
         """
+        import matplotlib.pyplot as plt  # Only imported when plotting
+
         fig, ax = plt.subplots(figsize=(10, 6))
         stat = self._statistic.copy()
         year = stat["year"].values
@@ -114,6 +156,8 @@ class Population:
         """
         Plot on the same graph the amount of each species in the population over time
         """
+        import matplotlib.pyplot as plt  # Only imported when plotting
+
         fig, ax = plt.subplots(figsize=(10, 6))
         for group in self._tree_groups:
             ax.plot(self._statistic['year'], self._statistic[group], label=species_label_map[group])
@@ -135,40 +179,124 @@ class Population:
         """
         self._wind_strategy = config.wind_strategy
         self.species_label_map = config.species_label_map
+        self._projection = local_projection(config.bounding_box)
         initial_forest = self.create_trees(df)
 
         # Assert initial trees are in the simulation environment
+        trees = []
         for tree in initial_forest:
-            if (config.bounding_box[0][0] <= tree._lat <= config.bounding_box[1][0] and
-                    config.bounding_box[0][1] <= tree._long <= config.bounding_box[1][1]):
-                self._trees.append(tree)
+            if self._projection.contains(tree._north, tree._east):
+                trees.append(tree)
 
-        self._trees_alive.update(self._trees.copy())
-        print("Number of Trees Alive:", len(self._trees_alive))
+        self._trees_alive.update(trees)
+        self.init_spatial_index(config)
+        for tree in trees:
+            self._spatial_index.insert(tree, tree._north, tree._east)
+        if config.verbose:
+            print("Number of Trees Alive:", len(self._trees_alive))
+
+        self._tree_groups = list(set([tree._species for tree in trees]))
+        self.init_instrumentation(config)
+        self._current_tree_id = max([self._current_tree_id] + [tree.id for tree in trees])
+
+        species = np.array([tree._species for tree in trees], dtype=np.int64)
+        self.init_lifecycle(config,
+                            np.array([tree.id for tree in trees], dtype=np.int64),
+                            np.array([tree._north for tree in trees], dtype=np.float64),
+                            np.array([tree._east for tree in trees], dtype=np.float64),
+                            species,
+                            np.array([tree._age for tree in trees], dtype=np.int64))
+        self.init_statistic(config, species, np.array([tree._height_level for tree in trees], dtype=np.int64))
+
+    def init_statistic(self, config, species, height_level):
+        """
+        Create the statistic with the starting year as first row, species and height_level are the arrays of the
+        initial trees
+        """
+        self._stats = PopulationStatistic(self._starting_year, self._tree_groups, config.simulation_duration,
+                                          height_histogram=config.height_histogram)
+        # init the statistic with the starting year
+        self._stats.add(species)
+        self._stats.count_heights(species, height_level)
+        self._stats.record()
+        if config.verbose:
+            print(self._statistic)
 
-        self._tree_groups = list(set([tree._species for tree in self._trees]))
+    def init_instrumentation(self, config):
+        """
+        Enable the per year instrumentation and the profiler if requested in the config
+        """
+        profiler = cProfile.Profile() if config.profiler == "cprofile" else None
+        self._instrumentation = Instrumentation(config.instrumentation, profiler=profiler)
 
-        trees_per_group = {}
-        for group in self._tree_groups:
-            trees_per_group[group] = 0
-        for tree in self._trees:
-            trees_per_group[tree._species] += 1
+    def init_lifecycle(self, config, ids, norths, easts, species, ages):
+        """
+        Create the lifecycle log with the births of the initial trees (in the year they were planted)
+        """
+        path = config.result_path + "lifecycle/" if config.lifecycle_log else None
+        self._lifecycle = LifecycleLog(self._starting_year, path)
+        self._lifecycle.births(self._starting_year - ages, ids, *self._projection.to_lat_long(norths, easts), species)
+        self._lifecycle.end_year()
 
-        stat_columns = ['year', 'population_size'] + self._tree_groups
-        self._statistic = pd.DataFrame(columns=stat_columns)
-        # init the statistic with the starting year
-        initial_row = {'year': self._starting_year, 'population_size': len(self._trees)}
-        initial_row.update(trees_per_group)
+    def columns(self):
+        """
+        Columns of the living trees, with their positions as lat and long (used by the outputs)
+        """
+        return self.lat_long_columns(self.trees_columns())
 
-        self._statistic.loc[0] = initial_row
-        print(self._statistic)
+    def lat_long_columns(self, columns):
+        """
+        Replace the north and east columns of trees columns by the lat and long of the positions
+        """
+        columns = dict(columns)
+        lat, long = self._projection.to_lat_long(columns.pop("north"), columns.pop("east"))
+        return {"id": columns.pop("id"), "lat": lat, "long": long, **columns}
+
+    def trees_columns(self):
+        """
+        Columns of the living trees, in self._trees_alive order (used by the checkpoints)
+        """
+        trees = list(self._trees_alive)
+        return {
+            "id": np.array([tree.id for tree in trees], dtype=np.int64),
+            "north": np.array([tree._north for tree in trees], dtype=np.float64),
+            "east": np.array([tree._east for tree in trees], dtype=np.float64),
+            "species": np.array([tree._species for tree in trees], dtype=np.int64),
+            "age": np.array([tree._age for tree in trees], dtype=np.int64),
+            "height_level": np.array([tree._height_level for tree in trees], dtype=np.int64),
+            "spreading_factor": np.array([tree._spreading_factor for tree in trees], dtype=np.float64),
+        }
+
+    def restore_trees(self, columns, config):
+        """
+        Rebuild the trees from the columns returned by trees_columns
+        """
+        self._projection = local_projection(config.bounding_box)
+        trees = [Tree(*values) for values in zip(*(columns[name].tolist() for name in [
+            "id", "north", "east", "species", "height_level", "age", "spreading_factor"]))]
+        # Same insertion order as before the checkpoint so that trees at the same position keep their order
+        self._trees_alive = SortedKeyList(trees, key=lambda t: (t._north, t._east))
+        self.init_spatial_index(config)
+        for tree in self._trees_alive:
+            self._spatial_index.insert(tree, tree._north, tree._east)
+
+    def init_spatial_index(self, config):
+        """
+        Create the (empty) spatial index of the living trees
+        The cells are as large as the biggest space a seed needs to become a tree
+        """
+        cell_size = config.seed_living_space + max(spreading_factor_map.values())
+        self._spatial_index = GridIndex(cell_size)
 
     def add_tree(self, tree):
         """
         Add a new tree to population
         """
-        self._trees.append(tree)
         self._trees_alive.add(tree)
+        self._lifecycle.births(self._year, tree.id, *self._projection.to_lat_long(tree._north, tree._east),
+                               tree._species)
+        self._spatial_index.insert(tree, tree._north, tree._east)
+        self._stats.add(tree._species, tree._height_level)
 
     def remove_trees(self, trees):
         """
@@ -176,30 +304,45 @@ class Population:
         """
         for tree in trees:
             self._trees_alive.remove(tree)
+            self._spatial_index.remove(tree)
+            self._stats.remove(tree._species)
+            self._lifecycle.deaths(self._year, tree.id, *self._projection.to_lat_long(tree._north, tree._east),
+                                   tree._species)
 
     def get_trees(self, id):
         """
         Retrun a specific tree _ unused
+        A dead tree is rebuilt from its birth and death in the lifecycle log, with its age and height level at death
         """
-        return self._trees[id]
+        for tree in self._trees_alive:
+            if tree.id == id:
+                return tree
+        birth = self._lifecycle.find(id)
+        if birth is None:
+            return None
+        species = int(birth["species"])
+        north, east = self._projection.to_plane(float(birth["lat"]), float(birth["long"]))
+        death = self._lifecycle.find_death(id)
+        # No death record yet: the tree died during the current year, its events are written at the end of the year
+        age = int((death["year"] if death is not None else self._year) - birth["year"])
+        tree = Tree(id, north, east, species, int(Tree.compute_height_level(age)), age,
+                    get_spreading_factor_from_species(species))
+        tree._alive = False
+        return tree
 
     def update_trees_statistics(self, wind_info):
         """
         track the population statistic
         - Count the amount of trees per group self._tree_groups
         - Save the wind values
+        - Record the instrumentation of the year
         """
-        trees_per_group = {}
-        for group in self._tree_groups:
-            trees_per_group[group] = 0
-        for tree in self._trees_alive:
-            trees_per_group[tree._species] += 1
-
-        new_row = {'year': self._statistic.iloc[-1]['year'] + 1, 'population_size': len(self._trees_alive)}
-        new_row.update(trees_per_group)
-
-        self._statistic.loc[len(self._statistic)] = new_row
-        self._wind_dir_strength.append(wind_info)
+        with self._instrumentation.phase("statistics"):
+            trees_per_group = self._stats.record()
+            self._lifecycle.end_year()
+            self._wind_dir_strength.append(wind_info)
+        self._instrumentation.collect_index(self._spatial_index)
+        self._instrumentation.end_year(self._year)
         return trees_per_group
 
     def update_forest(self, config, year):
@@ -207,95 +350,133 @@ class Population:
         Main loop for population update
         """
         year = year + self._starting_year
+        self._year = year + 1
+        instrumentation = self._instrumentation
+        instrumentation.start_year()
+        tree_instrumentation = instrumentation if instrumentation.enabled else None
 
         forest_seeds = []
-        i = 0
+        # Surviving trees as (north, east, species, height level, spreading factor) when the seeds are streamed
+        parents = [] if config.seed_chunk_size else None
         trees_to_remove = []
-
-        if self._wind_strategy == "constant":
-            wind_direction = config.wind_direction
-            wind_strength = config.wind_strength
-        else:
-            wind_direction = np.random.uniform(0, 360)
-            wind_strength = np.random.randint(0, 35)
-
-        with alive_bar(total=len(self._trees_alive), title=f"Update Trees: [{year}]".format(i),
-                       spinner='classic') as bar:  # len(train_loader) = n_batches
-            for i, tree in enumerate(self._trees_alive):
-                # Update each tree
-                tree_seeds = tree.update(config, wind_direction, wind_strength)
-                forest_seeds = forest_seeds + tree_seeds
-
-                if not tree._alive:
-                    trees_to_remove.append(tree)
-                bar()
-
-            self._wind_dir_strength.append((wind_direction, wind_strength))
+        # Species and height level of the surviving trees, for the height histogram
+        heights = [] if self._stats.height_histogram_enabled else None
+
+        wind_direction, wind_strength = self.draw_wind(config)
+
+        # Wind at every tree, the same for all trees but with the wind field
+        winds = itertools.repeat((wind_direction, wind_strength))
+        if self._wind_strategy == "field":
+            positions = np.array([(tree._north, tree._east) for tree in self._trees_alive]).reshape(-1, 2)
+            winds = zip(*(wind.tolist() for wind in self.tree_wind(config, positions[:, 0], positions[:, 1],
+                                                                      wind_direction, wind_strength)))
+
+        with ProgressBar(config.progress_bars, len(self._trees_alive), f"Update Trees: [{year}]") as bar:
+            with instrumentation.phase("tree_update"):
+                for tree, (tree_wind_direction, tree_wind_strength) in zip(self._trees_alive, winds):
+                    # Update each tree
+                    tree_seeds = tree.update(config, tree_wind_direction, tree_wind_strength, tree_instrumentation,
+                                             seeding=parents is None)
+                    forest_seeds.extend(tree_seeds)
+
+                    if not tree._alive:
+                        trees_to_remove.append(tree)
+                    else:
+                        if heights is not None:
+                            heights.append((tree._species, tree._height_level))
+                        if parents is not None:
+                            parents.append((tree._north, tree._east, tree._species, tree._height_level,
+                                            tree._spreading_factor))
+                    bar()
 
             # remove trees
-            self.remove_trees(trees_to_remove)  # A dead tree can not be replace the year of its death
+            with instrumentation.phase("removal"):
+                self.remove_trees(trees_to_remove)  # A dead tree can not be replace the year of its death
+                if heights is not None:
+                    self._stats.count_heights(*np.array(heights, dtype=np.int64).reshape(-1, 2).T)
+
+        if parents is None:
+            self.plant_seeds(*seeds_to_arrays(forest_seeds), config)
+        else:
+            north, east, species, height_level, spreading_factor = np.array(parents, dtype=np.float64).reshape(-1, 5).T
+            self.plant_seed_chunks(north, east, species.astype(np.int64), height_level.astype(np.int64),
+                                   spreading_factor, wind_direction, wind_strength, config)
+        self.update_trees_statistics((wind_direction, wind_strength))
 
+    def plant_seeds(self, seeds_north, seeds_east, seeds_species, config):
+        """
+        Turn seeds into trees when there is enough space around them
+        The seeds are tried in uniformly random order, first come first served: a seed germinates if no living tree
+        and no seed accepted before it this year is closer than seed_living_space + spreading factor
+        """
         # Adapt group rules here
-        n_seed = len(forest_seeds)
-        planted = 0
-        with alive_bar(total=n_seed, title="Plant seed Trees: ".format(planted),
-                       spinner='classic') as bar:  # len(train_loader) = n_batches
-            while forest_seeds:
-                # Decide if seed becomes tree -> if enough space around
-                random_index = random.randint(0, len(forest_seeds) - 1)
-                seed = forest_seeds.pop(random_index)
-                radius = config.seed_living_space + spreading_factor_map[seed[1]]
-                planted += 1
-                if self.seed_has_enough_space_around(seed,
-                                                     radius=radius):  # retun -1 if not enough space, indice for insertion otherwise
-                    # Create new tree on new position
-                    self._current_tree_id += 1
-                    # print(f'new seed: {seed}')
-
-                    new_tree = Tree(self._current_tree_id,
-                                    seed[0][0],
-                                    seed[0][1],
-                                    seed[1],
-                                    0,
-                                    0,
-                                    get_spreading_factor_from_species(seed[1]))
-
-                    # Add new tree to forest
-                    self.add_tree(new_tree)
-                bar()
-            self.update_trees_statistics((wind_direction, wind_strength))
-
-    def seed_has_enough_space_around(self, seed, radius):
-        """
-        Assert that in specified radius, no tree already exists.
-        """
-        trees = self.trees_in_the_surroundings(seed[0][0], seed[0][1], radius)
-        for tree in trees:
-            if distance_between_coordinate(tree._lat, tree._long, seed[0][0], seed[0][1]) < radius:
-                return False
-        return True
+        instrumentation = self._instrumentation
+        with ProgressBar(config.progress_bars, len(seeds_north), "Plant seed Trees: ") as bar:
+            with instrumentation.phase("planting"):
+                planted = select_germinating_seeds(seeds_north, seeds_east, seeds_species, self._spatial_index,
+                                                   config, progress=bar,
+                                                   instrumentation=instrumentation if instrumentation.enabled else None)
+
+        with instrumentation.phase("planting"):
+            self.add_new_trees(seeds_north[planted], seeds_east[planted], seeds_species[planted])
+
+    def plant_seed_chunks(self, north, east, species, height_level, spreading_factor, wind_direction, wind_strength,
+                          config):
+        """
+        Generate the seeds of the given trees config.seed_chunk_size at a time and plant them as they come, the seeds
+        are tried in the same uniformly random order as plant_seeds but only the accepted ones are kept in memory
+        (the seeding time is part of the planting phase)
+        """
+        instrumentation = self._instrumentation
+        wind_direction, wind_strength = self.tree_wind(config, north, east, wind_direction, wind_strength)
+        total = int(seed_amount_per_height_level(config)[height_level].sum())
+        with ProgressBar(config.progress_bars, total, "Plant seed Trees: ") as bar:
+            with instrumentation.phase("planting"):
+                counters = instrumentation if instrumentation.enabled else None
+                chunks = seed_chunks(north, east, species, height_level, spreading_factor, wind_direction,
+                                     wind_strength, config, config.seed_chunk_size, instrumentation=counters)
+                planted = germinate_seed_chunks(chunks, self._spatial_index, config, progress=bar,
+                                                instrumentation=counters)
+                self.add_new_trees(*planted)
+
+    def add_new_trees(self, norths, easts, species):
+        """
+        Create new trees (age 0) at the given positions and add them to the population
+        """
+        for north, east, group in zip(norths.tolist(), easts.tolist(), species.tolist()):
+            self._current_tree_id += 1
+            self.add_tree(Tree(self._current_tree_id, north, east, group, 0, 0,
+                               get_spreading_factor_from_species(group)))
 
-    def trees_in_the_surroundings(self, lat, long, radius):
+    def draw_wind(self, config):
         """
-        Returns a restricted list of trees potentially inside the empty space required for the speed to trun into a tree
+        Wind of the year according to the wind strategy (its mean over the wind field with the "field" strategy)
+        :return: (wind direction in degrees, wind strength)
         """
-        lat_min, long_min, lat_max, long_max = box_around_lat_long(lat, long, radius)
-        trees = self._trees_alive.irange_key((lat_min, long_min), (lat_max, long_max))
+        if self._wind_strategy == "constant":
+            return config.wind_direction, config.wind_strength
+        if self._wind_strategy == "field":
+            return wind_field(config).summary(self._year - self._starting_year - 1)
+        return np.random.uniform(0, 360), np.random.randint(0, 35)
 
-        return trees
+    def tree_wind(self, config, north, east, wind_direction, wind_strength):
+        """
+        Wind at the given positions: the wind of the year (as returned by draw_wind), or with the "field" wind
+        strategy the wind field of the year interpolated at every position (see src/wind.py)
+        :return: (wind direction in degrees, wind strength), scalars or arrays
+        """
+        if self._wind_strategy != "field":
+            return wind_direction, wind_strength
+        return wind_field(config).at(self._year - self._starting_year - 1, north, east)
 
     def create_trees(self, df):
         """
-        Creates the trees from the inital dataframe
+        Creates the trees from the inital dataframe, their positions are projected on the plane of the simulation
         """
+        norths, easts = self._projection.to_plane(df["lat"].to_numpy(dtype=np.float64),
+                                                  df["long"].to_numpy(dtype=np.float64))
         forest = []
-        for row in df.iterrows():
-            location = row[1]["SHAPE"].split("(")[1].split(")")[0].split()
-            forest.append(Tree(row[0],
-                               float(location[1]),
-                               float(location[0]),
-                               row[1]["GRUPPE"],
-                               row[1]["BAUMHOEHE"],
-                               row[1]["ALTERab2023"],
-                               get_spreading_factor_from_species(row[1]["GRUPPE"])))
+        for id, north, east, group, height, age in zip(df.index, norths.tolist(), easts.tolist(), df["GRUPPE"],
+                                                       df["BAUMHOEHE"], df["ALTERab2023"]):
+            forest.append(Tree(id, north, east, group, height, age, get_spreading_factor_from_species(group)))
         return forest
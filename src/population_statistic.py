@@ -0,0 +1,128 @@
+import numpy as np
+import pandas as pd
+
+"""
+Yearly population statistic kept incrementally
+"""
+
+HEIGHT_LEVELS = 9  # height levels go from 0 to 8 (see Tree.compute_height_level)
+
+
+class PopulationStatistic:
+    """
+    Counts the living trees of each group as they are added and removed, and records the counters once a year in
+    preallocated arrays. The DataFrame is only built on output.
+    Optionally keeps a year x group x height level histogram, filled from the height levels computed by the yearly
+    update so no extra pass over the population is needed.
+    """
+
+    def __init__(self, starting_year, tree_groups, duration, height_histogram=False):
+        self.starting_year = starting_year
+        self.tree_groups = list(tree_groups)
+        self._column_of_group = np.full(max(self.tree_groups, default=0) + 1, -1, dtype=np.int64)
+        self._column_of_group[self.tree_groups] = np.arange(len(self.tree_groups))
+
+        self._n_years = 0
+        self._counts = np.zeros((duration + 1, len(self.tree_groups)), dtype=np.int64)
+        self._current = np.zeros(len(self.tree_groups), dtype=np.int64)
+        self._histogram = None
+        self._current_histogram = None
+        if height_histogram:
+            self._histogram = np.zeros((duration + 1, len(self.tree_groups), HEIGHT_LEVELS), dtype=np.int64)
+            self._current_histogram = np.zeros((len(self.tree_groups), HEIGHT_LEVELS), dtype=np.int64)
+
+    def _columns(self, species):
+        return self._column_of_group[np.atleast_1d(species)]
+
+    def add(self, species, height_level=0):
+        """
+        Count new trees, species (and height_level) are scalars or arrays
+        """
+        columns = self._columns(species)
+        np.add.at(self._current, columns, 1)
+        if self._current_histogram is not None:
+            np.add.at(self._current_histogram, (columns, np.broadcast_to(height_level, columns.shape)), 1)
+
+    def remove(self, species):
+        """
+        Uncount dead trees, species is a scalar or an array
+        """
+        np.subtract.at(self._current, self._columns(species), 1)
+
+    def count_heights(self, species, height_level):
+        """
+        Set the height histogram from the trees updated this year (arrays of their species and height levels),
+        the trees added afterwards are counted by add
+        """
+        if self._current_histogram is None:
+            return
+        self._current_histogram[:] = 0
+        np.add.at(self._current_histogram, (self._columns(species), np.atleast_1d(height_level)), 1)
+
+    @property
+    def height_histogram_enabled(self):
+        return self._histogram is not None
+
+    def record(self):
+        """
+        Save the current counters as the statistic of the next year
+        :return: trees per group
+        """
+        if self._n_years == len(self._counts):
+            self._grow()
+        self._counts[self._n_years] = self._current
+        if self._histogram is not None:
+            self._histogram[self._n_years] = self._current_histogram
+        self._n_years += 1
+        return dict(zip(self.tree_groups, self._current.tolist()))
+
+    def _grow(self):
+        self._counts = np.concatenate([self._counts, np.zeros_like(self._counts)])
+        if self._histogram is not None:
+            self._histogram = np.concatenate([self._histogram, np.zeros_like(self._histogram)])
+
+    def to_frame(self):
+        """
+        Statistic as a DataFrame with the columns year, population_size and one column per group
+        """
+        counts = self._counts[:self._n_years]
+        stat = pd.DataFrame(counts, columns=self.tree_groups)
+        stat.insert(0, 'population_size', counts.sum(axis=1))
+        stat.insert(0, 'year', self.starting_year + np.arange(self._n_years))
+        return stat
+
+    def height_histogram_frame(self):
+        """
+        Height histogram as a long DataFrame with the columns year, group, height_level and count
+        """
+        years, groups, levels = np.meshgrid(self.starting_year + np.arange(self._n_years),
+                                            self.tree_groups, np.arange(HEIGHT_LEVELS), indexing='ij')
+        return pd.DataFrame({'year': years.ravel(), 'group': groups.ravel(), 'height_level': levels.ravel(),
+                             'count': self._histogram[:self._n_years].ravel()})
+
+    def columns(self):
+        """
+        State of the statistic as arrays (used by the checkpoints)
+        """
+        columns = {"groups": np.array(self.tree_groups, dtype=np.int64),
+                   "counts": self._counts[:self._n_years],
+                   "current": self._current}
+        if self._histogram is not None:
+            columns["histogram"] = self._histogram[:self._n_years]
+            columns["current_histogram"] = self._current_histogram
+        return columns
+
+    @classmethod
+    def from_columns(cls, columns, starting_year, duration):
+        """
+        Rebuild the statistic saved by columns
+        """
+        statistic = cls(starting_year, columns["groups"].tolist(), max(duration, len(columns["counts"]) - 1),
+                        height_histogram="histogram" in columns)
+        statistic._n_years = len(columns["counts"])
+        statistic._counts[:statistic._n_years] = columns["counts"]
+        statistic._current[:] = columns["current"]
+        if statistic._histogram is not None:
+            statistic._histogram[:statistic._n_years] = columns["histogram"]
+            statistic._current_histogram[:] = columns["current_histogram"]
+        return statistic
@@ -0,0 +1,192 @@
+import numpy as np
+
+from src.habitat import habitat_mask
+from src.projection import local_projection
+from src.spatial_index import GridIndex
+from src.utils import get_spreading_factors_from_species
+
+"""
+Batched seed dispersal, generates the seeds of many trees in one pass with array operations
+"""
+
+
+def seed_amount_per_height_level(config):
+    """
+    Amount of germinating seeds for each height level as an array indexed by height level
+    """
+    seed_amount = np.zeros(max(config.seed_amount_map) + 1, dtype=np.int64)
+    for height_level, amount in config.seed_amount_map.items():
+        seed_amount[height_level] = int(amount * 0.1)  # Keep propotions
+    return seed_amount
+
+
+def disperse_seeds(north, east, species, height_level, spreading_factor, wind_direction, wind_strength, config,
+                   rng=None, instrumentation=None):
+    """
+    Generate the seeds of the given trees
+    Method: every seed is drawn at a random angle and a random distance from the center of a circle whose radius is
+    default_seeding_radius * spreading_factor, the center is at wind_strength * spreading_factor from the tree in the
+    wind direction. The positions are in meters on the plane of the simulation (see LocalProjection).
+    With config.habitat_mask the seeds falling in the Danube or outside Vienna are dropped (see src/habitat.py).
+
+    :param north, east, species, height_level, spreading_factor: arrays with one value per tree
+    :param wind_direction: bearing of the wind in degrees (0 is North), scalar or one value per tree
+    :param wind_strength: scalar or one value per tree
+    :param rng: numpy Generator to draw from, the global np.random state if None
+    :param instrumentation: optional Instrumentation counting the seeds generated and out of the bounding box
+    :return: (north, east, species) arrays of the seeds falling inside the bounding box
+    """
+    random_state = np.random if rng is None else rng
+    seed_amount = seed_amount_per_height_level(config)[height_level]
+    center_north, center_east = seeding_centers(north, east, spreading_factor, wind_direction, wind_strength)
+    parent = np.repeat(np.arange(len(seed_amount)), seed_amount)
+    return seeds_of(parent, center_north, center_east, species, spreading_factor, config, random_state,
+                    instrumentation)
+
+
+def seeding_centers(north, east, spreading_factor, wind_direction, wind_strength):
+    """
+    Center of the seeding circle of every tree, wind_strength * spreading_factor away from it in the wind direction
+    """
+    bearing = np.radians(wind_direction)
+    distance_meters = wind_strength * spreading_factor
+    return north + distance_meters * np.cos(bearing), east + distance_meters * np.sin(bearing)
+
+
+def seeds_of(parent, center_north, center_east, species, spreading_factor, config, random_state,
+             instrumentation=None):
+    """
+    Draw one seed per item of parent (index of the tree) in the seeding circle of the tree, see disperse_seeds
+    :return: (north, east, species) arrays of the seeds falling inside the bounding box (and the habitat mask)
+    """
+    # Random position in the circle, in polar coordinate
+    theta = random_state.uniform(0, 2 * np.pi, len(parent))
+    r = random_state.uniform(0, 1, len(parent)) * config.default_seeding_radius * spreading_factor[parent]
+    seed_north = center_north[parent] + r * np.sin(theta)
+    seed_east = center_east[parent] + r * np.cos(theta)
+
+    # Check if the generated points are within the bounding box
+    inside = local_projection(config.bounding_box).contains(seed_north, seed_east)
+    if instrumentation is not None:
+        instrumentation.count("seeds_generated", len(parent))
+        instrumentation.count("seeds_out_of_bounds", len(parent) - int(np.count_nonzero(inside)))
+
+    # Drop the seeds falling in the Danube or outside Vienna
+    mask = habitat_mask(config)
+    if mask is not None:
+        in_box = np.flatnonzero(inside)
+        inside[in_box] = mask.habitable(seed_north[in_box], seed_east[in_box])
+        if instrumentation is not None:
+            instrumentation.count("seeds_off_habitat", len(in_box) - int(np.count_nonzero(inside)))
+    return seed_north[inside], seed_east[inside], species[parent][inside]
+
+
+def seed_chunks(north, east, species, height_level, spreading_factor, wind_direction, wind_strength, config,
+                chunk_size, rng=None, instrumentation=None):
+    """
+    Generator of the seeds of the given trees (see disperse_seeds) in uniformly random order, about chunk_size seeds
+    at a time, so that the seeds of the year are never all in memory.
+    Every seed gets a uniform priority and the chunks are slabs of priorities: the amount of seeds of a tree in the
+    next slab is binomial over its seeds not generated yet, their positions are only drawn then and the slab is
+    shuffled.
+    :return: iterator of (amount of seeds generated, (north, east, species) arrays of the seeds inside the bounding
+             box)
+    """
+    random_state = np.random if rng is None else rng
+    remaining = seed_amount_per_height_level(config)[height_level]
+    center_north, center_east = seeding_centers(north, east, spreading_factor, wind_direction, wind_strength)
+    n_chunks = max(1, -(-int(remaining.sum()) // chunk_size))
+    for chunk in range(n_chunks):
+        amount = random_state.binomial(remaining, 1 / (n_chunks - chunk))
+        remaining -= amount
+        parent = np.repeat(np.arange(len(amount)), amount)
+        random_state.shuffle(parent)
+        yield len(parent), seeds_of(parent, center_north, center_east, species, spreading_factor, config,
+                                    random_state, instrumentation)
+
+
+def seeds_to_arrays(seeds):
+    """
+    Convert a list of seeds ((north, east), species) as returned by Tree.seeding to (north, east, species) arrays
+    """
+    seeds_north = np.array([seed[0][0] for seed in seeds], dtype=np.float64)
+    seeds_east = np.array([seed[0][1] for seed in seeds], dtype=np.float64)
+    seeds_species = np.array([seed[1] for seed in seeds], dtype=np.int64)
+    return seeds_north, seeds_east, seeds_species
+
+
+def select_germinating_seeds(seeds_north, seeds_east, seeds_species, trees_index, config, rng=None, progress=None,
+                             instrumentation=None):
+    """
+    Decide which seeds become trees
+    The seeds are tried in uniformly random order, first come first served: a seed germinates if no living tree
+    and no seed accepted before it is closer than seed_living_space + spreading factor
+
+    :param trees_index: GridIndex of the living trees
+    :param rng: numpy Generator to draw the order from, the global np.random state if None
+    :param progress: optional callable, called with the amount of seeds processed
+    :param instrumentation: optional Instrumentation counting the rejected seeds and the neighbour queries between
+                            the seeds of the year (the queries on trees_index are counted by its owner)
+    :return: indices of the germinating seeds, in the order they were accepted
+    """
+    random_state = np.random if rng is None else rng
+    order = random_state.permutation(len(seeds_north))
+    radii = config.seed_living_space + get_spreading_factors_from_species(seeds_species)
+
+    # Seeds too close to an existing tree can never germinate, whatever their order
+    free = ~trees_index.any_within_many(seeds_north[order], seeds_east[order], radii[order])
+    candidates = order[free]
+    if progress is not None:
+        progress(len(order) - len(candidates))
+
+    # Resolve the conflicts between the remaining seeds in their random order
+    accepted_seeds = GridIndex(trees_index.cell_size)
+    planted = accept_seeds(candidates, seeds_north, seeds_east, radii, accepted_seeds, progress)
+    if instrumentation is not None:
+        instrumentation.count("seeds_rejected_by_trees", len(order) - len(candidates))
+        instrumentation.count("seeds_rejected_by_seeds", len(candidates) - len(planted))
+        instrumentation.count("seeds_planted", len(planted))
+        instrumentation.collect_index(accepted_seeds)
+    return np.array(planted, dtype=np.int64)
+
+
+def accept_seeds(candidates, seeds_north, seeds_east, radii, accepted_seeds, progress=None):
+    """
+    Accept the candidate seeds in order when no seed of accepted_seeds (GridIndex, updated) is too close
+    :return: list of the accepted candidates
+    """
+    planted = []
+    for i in candidates.tolist():
+        if not accepted_seeds.any_within(seeds_north[i], seeds_east[i], radii[i]):
+            accepted_seeds.insert(len(accepted_seeds), seeds_north[i], seeds_east[i])
+            planted.append(i)
+        if progress is not None:
+            progress()
+    return planted
+
+
+def germinate_seed_chunks(chunks, trees_index, config, progress=None, instrumentation=None):
+    """
+    Streaming version of select_germinating_seeds, over the chunks of seeds of seed_chunks (already in random
+    order). Only the accepted seeds are kept from one chunk to the next.
+    :param progress: optional callable, called with the amount of seeds processed
+    :return: (north, east, species) arrays of the germinating seeds, in the order they were accepted
+    """
+    accepted_seeds = GridIndex(trees_index.cell_size)
+    planted = []
+    for generated, (seeds_north, seeds_east, seeds_species) in chunks:
+        radii = config.seed_living_space + get_spreading_factors_from_species(seeds_species)
+        candidates = np.flatnonzero(~trees_index.any_within_many(seeds_north, seeds_east, radii))
+        accepted = accept_seeds(candidates, seeds_north, seeds_east, radii, accepted_seeds)
+        planted.append((seeds_north[accepted], seeds_east[accepted], seeds_species[accepted]))
+        if instrumentation is not None:
+            instrumentation.count("seeds_rejected_by_trees", len(seeds_north) - len(candidates))
+            instrumentation.count("seeds_rejected_by_seeds", len(candidates) - len(accepted))
+            instrumentation.count("seeds_planted", len(accepted))
+        if progress is not None:
+            progress(generated)
+    if instrumentation is not None:
+        instrumentation.collect_index(accepted_seeds)
+    if not planted:
+        return np.empty(0), np.empty(0), np.empty(0, dtype=np.int64)
+    return tuple(np.concatenate(column) for column in zip(*planted))
@@ -0,0 +1,132 @@
+import math
+
+import numpy as np
+
+"""
+Spatial index used for the neighbour queries of the seeds
+"""
+
+
+class GridIndex:
+    """
+    Uniform grid (cell hash) over the metric plane of the simulation (north, east in meters, see LocalProjection).
+    Every cell keeps the trees located in it, so insertion and deletion are O(1) and a neighbour query only looks at
+    the cells around the searched position.
+    """
+
+    def __init__(self, cell_size):
+        """
+        :param cell_size: side of a cell in meters, ideally the largest search radius
+        """
+        self.cell_size = cell_size
+        self._cells = {}  # (i, j) -> {key: (north, east)}
+        self._cell_of = {}  # key -> (i, j)
+        # Amount of neighbour queries and of candidate elements compared, read by Instrumentation.collect_index
+        self.queries = 0
+        self.scanned = 0
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def _cell(self, north, east):
+        return math.floor(north / self.cell_size), math.floor(east / self.cell_size)
+
+    def insert(self, key, north, east):
+        """
+        Add an element at the given position, key is any hashable identifying it (tree or row)
+        """
+        cell = self._cell(north, east)
+        self._cells.setdefault(cell, {})[key] = (north, east)
+        self._cell_of[key] = cell
+
+    def insert_many(self, keys, norths, easts):
+        """
+        Add several elements at once
+        """
+        for key, north, east in zip(keys, norths, easts):
+            self.insert(key, float(north), float(east))
+
+    def remove(self, key):
+        """
+        Remove an element from the index
+        """
+        cell = self._cell_of.pop(key)
+        content = self._cells[cell]
+        del content[key]
+        if not content:
+            del self._cells[cell]
+
+    def candidates(self, north, east, radius):
+        """
+        Keys of the elements in the cells overlapping the square of half side radius around the position
+        """
+        i, j = self._cell(north, east)
+        rings = max(1, math.ceil(radius / self.cell_size))
+        keys = []
+        for di in range(-rings, rings + 1):
+            for dj in range(-rings, rings + 1):
+                content = self._cells.get((i + di, j + dj))
+                if content:
+                    keys.extend(content)
+        return keys
+
+    def any_within(self, north, east, radius):
+        """
+        Assert if at least one element is strictly closer than radius (in meters) to the position
+        """
+        candidates = self.candidates(north, east, radius)
+        self.queries += 1
+        self.scanned += len(candidates)
+        squared_radius = radius * radius
+        for key in candidates:
+            other_north, other_east = self._cells[self._cell_of[key]][key]
+            if (north - other_north) ** 2 + (east - other_east) ** 2 < squared_radius:
+                return True
+        return False
+
+    def any_within_many(self, norths, easts, radii):
+        """
+        Batched version of any_within, the positions are grouped by cell so that the candidates of a cell are
+        gathered once and compared to all the positions of the cell with array operations
+
+        :return: boolean array, True where at least one element is closer than the radius
+        """
+        norths = np.asarray(norths, dtype=np.float64)
+        easts = np.asarray(easts, dtype=np.float64)
+        radii = np.broadcast_to(np.asarray(radii, dtype=np.float64), norths.shape)
+        result = np.zeros(len(norths), dtype=bool)
+        self.queries += len(norths)
+        if len(norths) == 0 or not self._cells:
+            return result
+
+        cell_i = np.floor(norths / self.cell_size).astype(np.int64)
+        cell_j = np.floor(easts / self.cell_size).astype(np.int64)
+        order = np.lexsort((cell_j, cell_i))
+        cell_i, cell_j = cell_i[order], cell_j[order]
+        group_starts = np.flatnonzero(np.r_[True, (np.diff(cell_i) != 0) | (np.diff(cell_j) != 0)])
+        group_ends = np.r_[group_starts[1:], len(order)]
+
+        for start, end in zip(group_starts, group_ends):
+            indices = order[start:end]
+            group_radii = radii[indices]
+            rings = max(1, math.ceil(group_radii.max() / self.cell_size))
+            positions = self._gather(int(cell_i[start]), int(cell_j[start]), rings)
+            if len(positions) == 0:
+                continue
+            self.scanned += len(indices) * len(positions)
+            squared_distances = ((norths[indices, None] - positions[None, :, 0]) ** 2 +
+                                 (easts[indices, None] - positions[None, :, 1]) ** 2)
+            result[indices] = (squared_distances < group_radii[:, None] ** 2).any(axis=1)
+        return result
+
+    def _gather(self, i, j, rings):
+        """
+        Positions of every element in the cells around (i, j), as a (n, 2) array
+        """
+        positions = []
+        for di in range(-rings, rings + 1):
+            for dj in range(-rings, rings + 1):
+                content = self._cells.get((i + di, j + dj))
+                if content:
+                    positions.extend(content.values())
+        return np.array(positions, dtype=np.float64).reshape(-1, 2)
@@ -0,0 +1,264 @@
+import argparse
+import copy
+import hashlib
+import itertools
+import json
+import os
+import random
+import shutil
+import sys
+from multiprocessing import Pool
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from src.checkpoint import load_checkpoint, save_checkpoint
+from src.config import Config
+from src.ensemble import attach_columns, share_columns
+from src.utils import get_spreading_factors_from_species, import_data, read_columns, spreading_factor_map, write_columns
+from src.vectorized_population import VectorizedPopulation
+
+"""
+Parameter sweep: run the simulation for every combination of a parameter grid, from one ingested population, in a
+process pool, and store the yearly statistic of every run in one columnar results directory
+"""
+
+BASE_SPREADING_FACTORS = dict(spreading_factor_map)
+# Config attributes that do not change the statistic of a run, left out of its key
+OUTPUT_ATTRIBUTES = {"_Config__config", "root", "config_path", "result_path", "headless", "show_plot_on_the_fly",
+                     "workers", "parallel_tiles", "ensemble_replicates", "ensemble_quantiles", "render_workers",
+                     "render_queue", "verbose", "animation_format", "save_steps", "map_mode", "density_resolution",
+                     "density_age_shading", "stream_output", "snapshots", "snapshot_compression", "tiles",
+                     "tile_zoom_levels", "tile_size", "tree_size_visualization_max", "tree_size_visualization_min"}
+
+
+def sweep_points(grid):
+    """
+    Every combination of the parameter grid {name: [values]}, as a list of {name: value}
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+
+def run_key(config):
+    """
+    Hash identifying a run or a burn-in by its effective config (see point_config): the parameter values of the point,
+    the base config (seed, simulation_duration, data files...) and burn_in_years. A sweep restarted after one of them
+    changed does not reuse the runs or the burn-ins of the previous values.
+    """
+    values = {name: value for name, value in vars(config).items() if name not in OUTPUT_ATTRIBUTES}
+    return hashlib.sha256(json.dumps(values, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+def point_config(config, point):
+    """
+    Copy of the config with the parameters of the point. A parameter is a config attribute (seed_living_space,
+    default_seeding_radius, wind_strength...) or spreading_factor.<species>, which changes spreading_factor_map.
+    The spreading factors are module level, set_spreading_factors applies them in the process running the point.
+    """
+    point_config = copy.copy(config)
+    point_config.spreading_factors = dict(BASE_SPREADING_FACTORS)
+    for name, value in point.items():
+        if name.startswith("spreading_factor."):
+            point_config.spreading_factors[int(name.split(".", 1)[1])] = value
+        elif not hasattr(config, name):
+            raise ValueError(f"Unknown sweep parameter {name}")
+        else:
+            setattr(point_config, name, value)
+    # The runs only need their statistic
+    point_config.lifecycle_log = False
+    point_config.checkpoint_interval = None
+    point_config.progress_bars = False
+    point_config.verbose = False
+    point_config.instrumentation = False
+    point_config.profiler = None
+    return point_config
+
+
+def set_spreading_factors(config, columns=None):
+    """
+    Apply the spreading factors of a point config to spreading_factor_map, and to the initial trees columns if given
+    """
+    spreading_factor_map.clear()
+    spreading_factor_map.update(config.spreading_factors)
+    if columns is not None:
+        columns["spreading_factor"] = get_spreading_factors_from_species(columns["species"])
+
+
+def run_burn_in(spec, config, path):
+    """
+    Worker task: simulate the burn-in years from the initial population and save a checkpoint at path
+    """
+    columns = attach_columns(spec)
+    set_spreading_factors(config, columns)
+    random.seed(config.seed)
+    np.random.seed(config.seed)
+    population = VectorizedPopulation()
+    population.populate_from_columns(columns, config)
+    for year in range(config.burn_in_years):
+        population.update_forest(config, year)
+    save_checkpoint(population, path, config.burn_in_years)
+
+
+def run_point(spec, config, point, burn_in_path, path):
+    """
+    Worker task: run one point of the sweep, from the initial population or from its burn-in checkpoint, and write
+    its yearly statistic in path (columns year, population_size and one per group, with the point in point.json)
+    """
+    if burn_in_path is None:
+        columns = attach_columns(spec)
+        set_spreading_factors(config, columns)
+        random.seed(config.seed)
+        np.random.seed(config.seed)
+        population = VectorizedPopulation()
+        population.populate_from_columns(columns, config)
+        start_year = 0
+    else:
+        set_spreading_factors(config)
+        population, start_year = load_checkpoint(burn_in_path, config)
+        # The trees of the burn-in get the spreading factors of the point
+        forest = population._trees
+        forest.spreading_factor[:] = get_spreading_factors_from_species(forest.species)
+    for year in range(start_year, config.simulation_duration):
+        population.update_forest(config, year)
+
+    statistic = population._statistic.rename(columns=config.species_label_map)
+    tmp_path = path.rstrip("/") + ".tmp/"
+    write_columns(tmp_path, {str(name): statistic[name].to_numpy() for name in statistic.columns})
+    with open(tmp_path + "point.json", "w") as f:
+        json.dump(point, f)
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    os.rename(tmp_path, path)
+
+
+def run_sweep(config, grid, path, burn_in_years=0, burn_in_parameters=(), workers=None):
+    """
+    Run every point of the grid not already finished in path, then gather all the runs in path/results/
+    :param grid: {parameter: [values]}, see point_config for the parameter names
+    :param burn_in_years: years simulated once for all the points sharing the values of burn_in_parameters (the
+                          other parameters keep their config values during the burn-in) and saved as checkpoints in
+                          path/burn_in/, the points resume from there
+    :return: DataFrame of the results, see load_sweep
+    """
+    points = sweep_points(grid)
+    # The runs resuming from a burn-in depend on its length, burn_in_years is part of every key
+    config = copy.copy(config)
+    config.burn_in_years = burn_in_years
+    runs_path = path + "runs/"
+    todo = [point for point in points if not os.path.isdir(runs_path + run_key(point_config(config, point)) + "/")]
+    print(f"{len(points) - len(todo)} of {len(points)} points already done")
+
+    # One burn-in per combination of the burn-in parameters
+    burn_ins = {}
+    if burn_in_years:
+        for point in todo:
+            burn_in_config = point_config(config, shared_parameters(point, burn_in_parameters))
+            burn_ins[run_key(burn_in_config)] = burn_in_config
+
+    population = VectorizedPopulation()
+    population.populate(import_data(config), point_config(config, {}))
+    blocks, spec = share_columns(population.columns())
+    try:
+        with Pool(workers) as pool:
+            tasks = []
+            for key, burn_in_config in burn_ins.items():
+                if not os.path.isdir(path + f"burn_in/{key}/"):
+                    tasks.append((spec, burn_in_config, path + f"burn_in/{key}/"))
+            pool.starmap(run_burn_in, tasks)
+
+            tasks = []
+            for point in todo:
+                burn_in_path = None
+                if burn_in_years:
+                    burn_in_config = point_config(config, shared_parameters(point, burn_in_parameters))
+                    burn_in_path = path + f"burn_in/{run_key(burn_in_config)}/"
+                tasks.append((spec, point_config(config, point), point, burn_in_path,
+                              runs_path + run_key(point_config(config, point)) + "/"))
+            for done, _ in enumerate(pool.imap_unordered(_run_point_star, tasks), start=1):
+                print(f"\t- {done}/{len(tasks)} points")
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+
+    return gather_sweep(config, path, points)
+
+
+def shared_parameters(point, burn_in_parameters):
+    """
+    Parameters of the point applied during the burn-in
+    """
+    return {name: point[name] for name in burn_in_parameters if name in point}
+
+
+def _run_point_star(args):
+    return run_point(*args)
+
+
+def gather_sweep(config, path, points):
+    """
+    Concatenate the runs of the points in path/results/, one column per parameter, year and statistic
+    :param config: config of the sweep, with its burn_in_years (see run_sweep)
+    """
+    frames = []
+    for point in points:
+        run = read_columns(path + "runs/" + run_key(point_config(config, point)) + "/", mmap_mode=None)
+        frame = pd.DataFrame(run)
+        for name, value in point.items():
+            frame.insert(0, name, value)
+        frames.append(frame)
+    results = pd.concat(frames, ignore_index=True)
+    tmp_path = path + "results.tmp/"
+    # Text parameters are saved as fixed width strings, so that the columns can be memory-mapped
+    columns = {name: results[name].to_numpy() for name in results.columns}
+    write_columns(tmp_path, {name: column.astype(str) if column.dtype == object else column
+                             for name, column in columns.items()})
+    with open(tmp_path + "parameters.json", "w") as f:
+        json.dump(sorted(points[0]) if points else [], f)
+    if os.path.isdir(path + "results/"):
+        shutil.rmtree(path + "results/")
+    os.rename(tmp_path, path + "results/")
+    return load_sweep(path)
+
+
+def load_sweep(path):
+    """
+    Results of a sweep as a DataFrame indexed by the parameters and the year
+    """
+    with open(path + "results/parameters.json", "r") as f:
+        parameters = json.load(f)
+    results = pd.DataFrame({name: np.asarray(column) for name, column in read_columns(path + "results/").items()})
+    return results.set_index(parameters + ["year"]).sort_index()
+
+
+def main():
+    """
+    Run a sweep described by a YAML file:
+        parameters:                     # values of every parameter, all the combinations are run
+            seed_living_space: [6, 8, 10]
+            spreading_factor.3: [0.4, 0.8]
+        burn_in_years: 20               # optional
+        burn_in_parameters: [seed_living_space]
+    """
+    parser = argparse.ArgumentParser(description="Run a parameter sweep of the simulation")
+    parser.add_argument("grid", help="YAML file of the sweep")
+    parser.add_argument("--workers", type=int, help="worker processes, all the cores by default")
+    parser.add_argument("--output", help="directory of the sweep, result_path/sweep/ by default")
+    args = parser.parse_args()
+
+    config = Config()
+    with open(args.grid, "r") as f:
+        sweep = yaml.safe_load(f)
+    path = args.output or config.result_path + "sweep/"
+    results = run_sweep(config, sweep["parameters"], path.rstrip("/") + "/",
+                        burn_in_years=sweep.get("burn_in_years", 0),
+                        burn_in_parameters=sweep.get("burn_in_parameters", []), workers=args.workers)
+    print(results)
+
+
+if __name__ == '__main__':
+    main()
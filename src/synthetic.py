@@ -0,0 +1,67 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from src.tree import Tree
+from src.utils import *
+
+"""
+Synthetic tree populations, in the format of import_data, for the benchmarks
+"""
+
+
+def synthetic_forest(n_trees, bounding_box, species_mix=None, age_mean=30, age_shape=2.0, age_max=150,
+                     clustered=0.0, n_clusters=50, cluster_radius=300, seed=0):
+    """
+    Generate a population of trees inside the bounding box
+
+    :param n_trees: amount of trees
+    :param species_mix: {species: weight}, every species of spreading_factor_map with the same weight by default
+    :param age_mean: mean age, the ages follow a gamma distribution of shape age_shape, cut at age_max
+    :param clustered: proportion of the trees drawn around n_clusters centers (normal spread of cluster_radius
+                      meters), the others are uniform over the bounding box
+    :return: DataFrame with the columns lat, long, GRUPPE, BAUMHOEHE and ALTERab2023 indexed by the tree id
+    """
+    rng = np.random.default_rng(seed)
+    (lat_min, long_min), (lat_max, long_max) = bounding_box
+
+    lat = rng.uniform(lat_min, lat_max, n_trees)
+    long = rng.uniform(long_min, long_max, n_trees)
+    n_clustered = int(n_trees * clustered)
+    if n_clustered:
+        centers = rng.integers(0, n_clusters, n_clustered)
+        center_lat = rng.uniform(lat_min, lat_max, n_clusters)[centers]
+        center_long = rng.uniform(long_min, long_max, n_clusters)[centers]
+        north, east = rng.normal(0, cluster_radius, (2, n_clustered))
+        cluster_lat, cluster_long = offset_coordinates(center_lat, center_long, north, east)
+        lat[:n_clustered] = np.clip(cluster_lat, lat_min, lat_max)
+        long[:n_clustered] = np.clip(cluster_long, long_min, long_max)
+
+    if species_mix is None:
+        species_mix = {species: 1 for species in spreading_factor_map}
+    weights = np.array(list(species_mix.values()), dtype=np.float64)
+    species = rng.choice(np.array(list(species_mix.keys()), dtype=np.int64), n_trees, p=weights / weights.sum())
+
+    ages = np.minimum(rng.gamma(age_shape, age_mean / age_shape, n_trees), age_max).astype(np.int64)
+
+    df = pd.DataFrame({"lat": lat, "long": long, "GRUPPE": species,
+                       "BAUMHOEHE": Tree.compute_height_level(ages), "ALTERab2023": ages},
+                      index=pd.RangeIndex(n_trees, name="id"))
+    return df
+
+
+def write_forest_csv(df, data_path, data_file, species_mapping_file):
+    """
+    Save a forest of synthetic_forest as a csv in the format of the tree inventory read by import_data (SHAPE as
+    POINT (long lat), GRUPPE as G<species>), with the mapping of the groups to their species id
+    """
+    os.makedirs(data_path, exist_ok=True)
+    pd.DataFrame({"SHAPE": "POINT (" + df["long"].astype(str) + " " + df["lat"].astype(str) + ")",
+                  "GRUPPE": "G" + df["GRUPPE"].astype(str),
+                  "BAUMHOEHE": df["BAUMHOEHE"],
+                  "ALTERab2023": df["ALTERab2023"]},
+                 index=df.index.rename("OBJECTID")).to_csv(data_path + data_file)
+    with open(data_path + species_mapping_file, "w", encoding="utf-8") as f:
+        json.dump({f"G{species}": int(species) for species in np.unique(df["GRUPPE"])}, f)
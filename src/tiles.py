@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import json
+import math
+import os
+import re
+import sys
+from functools import lru_cache
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+
+from src.utils import EARTH_RADIUS
+
+"""
+Tiled maps: every year is rendered in a z/x/y tile pyramid over the bounding box, browsable with a local viewer
+(python src/tiles.py result_path/tiles/)
+"""
+
+# RGB colors of the groups, in the order of the sorted group ids
+PALETTE = np.array([[31, 119, 180], [255, 127, 14], [44, 160, 44], [214, 39, 40], [148, 103, 189], [140, 86, 75],
+                    [227, 119, 194], [127, 127, 127], [188, 189, 34], [23, 190, 207], [174, 199, 232],
+                    [255, 187, 120], [152, 223, 138], [255, 152, 150], [197, 176, 213], [196, 156, 148]],
+                   dtype=np.uint8)
+BACKGROUND = np.array([255, 255, 255, 0], dtype=np.uint8)
+
+
+class TilePyramid:
+    """
+    Tiles of tile_size pixels over the bounding box, the zoom level z has 2^z x 2^z tiles (x from west to east, y from
+    north to south). Every tree is a dot of TREE_RADIUS meters (at least one pixel) colored by group.
+
+    Only the tiles touched by the trees born or dead since the previous year are rendered again, the others are
+    carried over. A tile is stored once per content in path/objects/<hash>.png, path/<year>.json maps every non
+    empty z/x/y of the year to its content.
+    """
+
+    TREE_RADIUS = 3  # meters
+
+    def __init__(self, config, tree_groups):
+        self.path = config.result_path + 'tiles/'
+        self.zoom_levels = config.tile_zoom_levels
+        self.tile_size = config.tile_size
+        (self.lat_min, self.long_min), (self.lat_max, self.long_max) = config.bounding_box
+        self.groups = sorted(tree_groups)
+        self._colors = np.zeros((max(self.groups, default=0) + 1, 3), dtype=np.uint8)
+        self._colors[self.groups] = PALETTE[np.arange(len(self.groups)) % len(PALETTE)]
+        # Width of the box in meters at its center latitude, to size the dots
+        center_lat = math.radians((self.lat_min + self.lat_max) / 2)
+        self._width_meters = math.radians(self.long_max - self.long_min) * EARTH_RADIUS * math.cos(center_lat)
+        self._manifest = {}  # "z/x/y" -> content hash of the last rendered year
+        self._ids = None  # ids of the trees of the last rendered year, sorted
+        self._positions = None
+        os.makedirs(self.path + 'objects/', exist_ok=True)
+        with open(self.path + 'pyramid.json', 'w') as f:
+            json.dump({"zoom_levels": self.zoom_levels, "tile_size": self.tile_size,
+                       "bounding_box": [[self.lat_min, self.long_min], [self.lat_max, self.long_max]]}, f)
+
+    def render_year(self, year, columns):
+        """
+        Update the pyramid with the living trees of the year (columns id, lat, long and species) and save its manifest
+        :return: amount of tiles rendered
+        """
+        order = np.argsort(columns["id"], kind="stable")
+        ids = columns["id"][order]
+        lat, long, species = columns["lat"][order], columns["long"][order], columns["species"][order]
+
+        if self._ids is None:
+            dirty_lat, dirty_long = None, None  # Everything is rendered the first year
+        else:
+            # Births and deaths since the previous year
+            born = ~np.isin(ids, self._ids, assume_unique=True)
+            dead = ~np.isin(self._ids, ids, assume_unique=True)
+            dirty_lat = np.concatenate([lat[born], self._positions[0][dead]])
+            dirty_long = np.concatenate([long[born], self._positions[1][dead]])
+
+        rendered = 0
+        for zoom in range(self.zoom_levels):
+            if dirty_lat is None:
+                tiles = None
+            else:
+                tiles = set(map(tuple, self.touched_tiles(zoom, dirty_lat, dirty_long)[0].tolist()))
+                if not tiles:
+                    continue
+            rendered += self.render_tiles(zoom, lat, long, species, tiles)
+
+        self._ids, self._positions = ids, (lat, long)
+        with open(self.path + f'{year}.json', 'w') as f:
+            json.dump(self._manifest, f)
+        return rendered
+
+    def pixels(self, zoom, lat, long):
+        """
+        Global pixel coordinates of the positions at a zoom level (x to the east, y to the south)
+        """
+        size = self.tile_size * 2 ** zoom
+        x = (long - self.long_min) / (self.long_max - self.long_min) * size
+        y = (self.lat_max - lat) / (self.lat_max - self.lat_min) * size
+        return x, y
+
+    def radius(self, zoom):
+        """
+        Radius of the dots in pixels at a zoom level
+        """
+        return max(1, round(self.TREE_RADIUS * self.tile_size * 2 ** zoom / self._width_meters))
+
+    def touched_tiles(self, zoom, lat, long):
+        """
+        Tiles touched by the dots of the trees, a tree near a border touches several tiles
+        :return: ((n, 2) array of the tiles (x, y), index of the tree of each row)
+        """
+        x, y = self.pixels(zoom, lat, long)
+        r = self.radius(zoom)
+        n_tiles = 2 ** zoom
+        tiles, trees = [], []
+        for dx in (-r, r):
+            for dy in (-r, r):
+                tile = np.stack([np.floor((x + dx) / self.tile_size), np.floor((y + dy) / self.tile_size)], axis=1)
+                tiles.append(np.clip(tile, 0, n_tiles - 1).astype(np.int64))
+                trees.append(np.arange(len(x)))
+        tiles, trees = np.concatenate(tiles), np.concatenate(trees)
+        # Same tile counted for several corners of a dot
+        _, unique = np.unique((tiles[:, 0] * n_tiles + tiles[:, 1]) * len(x) + trees, return_index=True)
+        return tiles[unique], trees[unique]
+
+    def trees_in_tiles(self, zoom, lat, long, tiles):
+        """
+        Mask of the trees whose dot touches one of the tiles (x, y)
+        """
+        n_tiles = 2 ** zoom
+        selected_tiles = np.zeros((n_tiles, n_tiles), dtype=bool)
+        selected_tiles[tuple(np.array(sorted(tiles)).T)] = True
+        x, y = self.pixels(zoom, lat, long)
+        r = self.radius(zoom)
+        mask = np.zeros(len(x), dtype=bool)
+        for dx in (-r, r):
+            for dy in (-r, r):
+                tile_x = np.clip(np.floor((x + dx) / self.tile_size), 0, n_tiles - 1).astype(np.int64)
+                tile_y = np.clip(np.floor((y + dy) / self.tile_size), 0, n_tiles - 1).astype(np.int64)
+                mask |= selected_tiles[tile_x, tile_y]
+        return mask
+
+    def render_tiles(self, zoom, lat, long, species, tiles=None):
+        """
+        Render the tiles of a zoom level (all of them if tiles is None), the trees are sorted by id
+        :return: amount of tiles rendered
+        """
+        if tiles is not None:
+            # Only the trees drawn in the tiles are sorted by tile, in the same order
+            selected = self.trees_in_tiles(zoom, lat, long, tiles)
+            lat, long, species = lat[selected], long[selected], species[selected]
+        touched, trees = self.touched_tiles(zoom, lat, long)
+        n_tiles = 2 ** zoom
+        key = touched[:, 0] * n_tiles + touched[:, 1]
+        order = np.argsort(key, kind="stable")
+        key, trees = key[order], trees[order]
+        if tiles is None:
+            tiles = [(tile_x, tile_y) for tile_x in range(n_tiles) for tile_y in range(n_tiles)]
+        x, y = self.pixels(zoom, lat, long)
+        for tile_x, tile_y in tiles:
+            tile_key = tile_x * n_tiles + tile_y
+            in_tile = trees[np.searchsorted(key, tile_key):np.searchsorted(key, tile_key, side="right")]
+            name = f"{zoom}/{tile_x}/{tile_y}"
+            if len(in_tile) == 0:
+                self._manifest.pop(name, None)
+                continue
+            image = self.draw(x[in_tile] - tile_x * self.tile_size, y[in_tile] - tile_y * self.tile_size,
+                              species[in_tile], self.radius(zoom))
+            self._manifest[name] = self.store(image)
+        return len(tiles)
+
+    def draw(self, x, y, species, radius):
+        """
+        RGBA image of a tile with a dot per tree at the given pixel coordinates (relative to the tile)
+        """
+        size = self.tile_size
+        image = np.zeros((size, size, 4), dtype=np.uint8)
+        image[:] = BACKGROUND
+        dy, dx = disk(radius)
+        rows = np.floor(y).astype(np.int64)[:, None] + dy
+        columns = np.floor(x).astype(np.int64)[:, None] + dx
+        inside = (0 <= rows) & (rows < size) & (0 <= columns) & (columns < size)
+        colors = np.broadcast_to(self._colors[species][:, None, :], rows.shape + (3,))
+        image[rows[inside], columns[inside], :3] = colors[inside]
+        image[rows[inside], columns[inside], 3] = 255
+        return image
+
+    def store(self, image):
+        """
+        Save the tile under its content hash if it is not stored yet
+        :return: hash
+        """
+        content = hashlib.sha256(image.tobytes()).hexdigest()[:20]
+        file = self.path + f'objects/{content}.png'
+        if not os.path.isfile(file):
+            import imageio.v2 as imageio
+            # Fast deflate level, the sparse tiles compress well anyway and the encoding dominates the rendering
+            imageio.imwrite(file + '.tmp', image, format='png', compress_level=1)
+            os.replace(file + '.tmp', file)
+        return content
+
+
+@lru_cache(maxsize=None)
+def disk(radius):
+    """
+    Pixel offsets (dy, dx) of a disk of the given radius
+    """
+    dy, dx = np.mgrid[-radius:radius + 1, -radius:radius + 1]
+    inside = dy ** 2 + dx ** 2 <= radius ** 2 + radius  # Rounder small disks
+    return dy[inside], dx[inside]
+
+
+VIEWER = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Tree propagation</title>
+<style>body{margin:0;font-family:sans-serif}#map{position:absolute;top:40px;bottom:0;left:0;right:0;overflow:hidden;
+background:#eee;cursor:grab}#map img{position:absolute;image-rendering:pixelated}#bar{height:40px;padding:8px}</style>
+</head><body>
+<div id="bar">Year <input id="year" type="range"> <span id="label"></span>
+zoom <button id="out">-</button> <span id="zoom"></span> <button id="in">+</button></div>
+<div id="map"></div>
+<script>
+let pyramid, years, zoom = 0, year = 0, cx = 0.5, cy = 0.5;
+const map = document.getElementById("map");
+function draw() {
+  const size = pyramid.tile_size, n = 2 ** zoom, w = map.clientWidth, h = map.clientHeight;
+  const left = w / 2 - cx * size * n, top = h / 2 - cy * size * n;
+  document.getElementById("label").textContent = years[year];
+  document.getElementById("zoom").textContent = zoom;
+  map.innerHTML = "";
+  for (let x = Math.max(0, Math.floor(-left / size)); x < Math.min(n, Math.ceil((w - left) / size)); x++) {
+    for (let y = Math.max(0, Math.floor(-top / size)); y < Math.min(n, Math.ceil((h - top) / size)); y++) {
+      const img = document.createElement("img");
+      img.src = `tile/${years[year]}/${zoom}/${x}/${y}.png`;
+      img.onerror = () => img.remove();
+      img.style.left = (left + x * size) + "px"; img.style.top = (top + y * size) + "px";
+      map.appendChild(img);
+    }
+  }
+}
+function setZoom(z) { zoom = Math.max(0, Math.min(pyramid.zoom_levels - 1, z)); draw(); }
+document.getElementById("in").onclick = () => setZoom(zoom + 1);
+document.getElementById("out").onclick = () => setZoom(zoom - 1);
+map.onwheel = e => { e.preventDefault(); setZoom(zoom + (e.deltaY < 0 ? 1 : -1)); };
+map.onmousedown = e => {
+  let x0 = e.clientX, y0 = e.clientY;
+  map.onmousemove = e => {
+    const scale = pyramid.tile_size * 2 ** zoom;
+    cx -= (e.clientX - x0) / scale; cy -= (e.clientY - y0) / scale; x0 = e.clientX; y0 = e.clientY; draw();
+  };
+};
+document.onmouseup = () => map.onmousemove = null;
+window.onresize = draw;
+fetch("pyramid.json").then(r => r.json()).then(p => { pyramid = p; return fetch("years"); })
+  .then(r => r.json()).then(y => {
+    years = y;
+    const slider = document.getElementById("year");
+    slider.max = years.length - 1; slider.value = 0;
+    slider.oninput = () => { year = +slider.value; draw(); };
+    draw();
+  });
+</script></body></html>
+"""
+
+
+class TileRequestHandler(SimpleHTTPRequestHandler):
+    """
+    Serves the viewer, the list of the years and the tiles of a pyramid directory (/tile/<year>/<z>/<x>/<y>.png)
+    """
+
+    manifests = {}
+    TILE_PATH = re.compile(r'/tile/(\d+)/(\d+)/(\d+)/(\d+)\.png')
+
+    def do_GET(self):
+        path = self.path.split('?')[0]
+        if path in ('/', '/index.html'):
+            return self.send_content(VIEWER.encode(), 'text/html')
+        if path == '/years':
+            years = sorted(int(file[:-5]) for file in os.listdir(self.directory) if file[:-5].isdigit())
+            return self.send_content(json.dumps(years).encode(), 'application/json')
+        if path.startswith('/tile/'):
+            match = self.TILE_PATH.fullmatch(path)
+            if match is None:
+                return self.send_error(404)
+            year, zoom, x, y = (str(int(value)) for value in match.groups())
+            content = self.manifest(year).get(f"{zoom}/{x}/{y}")
+            if content is None:
+                return self.send_error(404)
+            self.path = f'/objects/{content}.png'
+        return super().do_GET()
+
+    def manifest(self, year):
+        if year not in self.manifests:
+            file = os.path.join(self.directory, f'{year}.json')
+            if not os.path.isfile(file):
+                return {}
+            with open(file, 'r') as f:
+                self.manifests[year] = json.load(f)
+        return self.manifests[year]
+
+    def send_content(self, content, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def serve(path, port=8000):
+    """
+    Browse a tile pyramid on http://localhost:<port>/
+    """
+    handler = type('Handler', (TileRequestHandler,), {'manifests': {}})
+    server = ThreadingHTTPServer(('localhost', port), lambda *args: handler(*args, directory=path))
+    print(f"Serving {path} on http://localhost:{port}/")
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Browse the tiled maps of a simulation")
+    parser.add_argument("path", help="tiles directory of a run (result_path/tiles/)")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    serve(args.path, args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,20 +1,18 @@
-import random
-
 import numpy as np
-from geographiclib.geodesic import Geodesic
 
+from src.seeding import disperse_seeds
 from src.utils import *
 
 
 class Tree:
     """
-    Class representing each tree
+    Class representing each tree, located in meters on the plane of the simulation (see LocalProjection)
     """
 
-    def __init__(self, id, lat, long, species=1, height=0, age=0, spreading_factor=1):
+    def __init__(self, id, north, east, species=1, height=0, age=0, spreading_factor=1):
         self.id = id
-        self._lat = lat
-        self._long = long
+        self._north = north
+        self._east = east
         self._species = species
         self._height_level = height
         self._age = age
@@ -22,14 +20,16 @@ class Tree:
         self._alive = True
 
     def __repr__(self):
-        return f"Tree(id:{self.id}, position:({self._lat}, {self._long}), group:{self._species}, height:{self._height_level}, age:{self._age})"
+        return f"Tree(id:{self.id}, position:({self._north}, {self._east}), group:{self._species}, height:{self._height_level}, age:{self._age})"
 
-    def update(self, config, wind_direction, wind_strength):
+    def update(self, config, wind_direction, wind_strength, instrumentation=None, seeding=True):
         """
         Main update function for the trees:
             -   Adapt age, height
             -   Decide if the tree is alive
             -   Generate seeds
+        :param instrumentation: optional Instrumentation timing the seeding and counting the seeds
+        :param seeding: False when the seeds are generated by the population (see Population.plant_seed_chunks)
         :return: list of seeds
         """
         # Adapt individual rules here
@@ -37,35 +37,39 @@ class Tree:
         self._height_level = self.compute_height_level(self._age)
         self._alive = self.eval_mortality(self._age)
 
-        if self._alive:
-            tree_seeds = self.seeding(self._lat, self._long, wind_direction, wind_strength, self._spreading_factor,
-                                      config)
-            return tree_seeds
+        if self._alive and seeding:
+            if instrumentation is None:
+                return self.seeding(self._north, self._east, wind_direction, wind_strength, self._spreading_factor,
+                                    config)
+            with instrumentation.phase("seeding"):
+                return self.seeding(self._north, self._east, wind_direction, wind_strength, self._spreading_factor,
+                                    config, instrumentation=instrumentation)
         return []
 
-    def seeding(self, start_lat, start_long, wind_direction, wind_strength, spreading_factor, config):
+    def seeding(self, start_north, start_east, wind_direction, wind_strength, spreading_factor, config,
+                instrumentation=None):
         """"
         Generate tree seeds
         Method: generate seeds from random position in a circle whose center is at wind_strength * spreading_factor from the acctual tree
-        the circle radius is default factor * spreading factor
+        the circle radius is default factor * spreading factor (see disperse_seeds)
         """
-        # Calculate bearing of the wind in degrees (0 is North)
-        bearing = wind_direction
-
-        # Determine distance vector from input factors
-        distance_meters = wind_strength * spreading_factor
-
-        # Calculate center of circle new seeds
-        seeding_center = Geodesic.WGS84.Direct(start_lat, start_long, bearing, distance_meters)
-
-        return self.generate_random_seeds(lat_center=seeding_center['lat2'], long_center=seeding_center['lon2'],
-                                          config=config, radius=config.default_seeding_radius * spreading_factor)
-
-    def compute_height_level(self, age):
+        seeds_north, seeds_east, seeds_species = disperse_seeds(np.array([start_north]),
+                                                                np.array([start_east]),
+                                                                np.array([self._species]),
+                                                                np.array([self._height_level]),
+                                                                np.array([spreading_factor]),
+                                                                wind_direction, wind_strength, config,
+                                                                instrumentation=instrumentation)
+        return [((north, east), species) for north, east, species in
+                zip(seeds_north.tolist(), seeds_east.tolist(), seeds_species.tolist())]
+
+    @staticmethod
+    def compute_height_level(age):
         """
         Computes the Chapman-Richards growth model
 
-        Returns the height level of a tree
+        Returns the height level of a tree, accepts a numpy array of ages and then returns an array of levels
+        The levels are looked up in a table computed once per age (see height_level_model)
 
         Parameters
         ----------
@@ -82,25 +86,41 @@ class Tree:
                no. 4, pp. 327-336, 1999.
         """
 
+        return _height_level_table(age)
+
+    @staticmethod
+    def height_level_model(age):
+        """
+        Chapman-Richards height level of an array of ages, see compute_height_level
+        """
         alpha = 50  # Upper asymptote (max tree height)
         beta = 0.8  # Growth range
         rate = 0.08  # Growth rate
         slope = 0.3  # Slope of growth
 
         # flooring results to the next int
-        result = math.floor(alpha * (1 - beta * np.exp(-rate * age)) ** (1 / (1 - slope)))
+        result = np.floor(alpha * (1 - beta * np.exp(-rate * age)) ** (1 / (1 - slope))).astype(np.int64)
 
-        if result == 0:
-            return 0
-        else:
-            level = (result - 1) // 5 + 1
-            return min(level, 8)
+        return np.where(result == 0, 0, np.minimum((result - 1) // 5 + 1, 8))
 
-    def eval_mortality(self, age):
+    @staticmethod
+    def eval_mortality(age):
         """
         Determines if a tree is alive or dead based on a organism mortality probability distribution.
 
         Returns a boolean with True if tree gets to live on
+        """
+        survival_probability = Tree.survival_probability(age)
+
+        random_number = np.random.random()  # Generate a random number between 0 and 1
+
+        return random_number < survival_probability
+
+    @staticmethod
+    def survival_probability(age):
+        """
+        Probability for a tree to survive the year at the given age, accepts a numpy array of ages
+        The probabilities are looked up in a table computed once per age (see survival_probability_model)
 
         Parameters
         ----------
@@ -116,47 +136,46 @@ class Tree:
         Survival time and mortality rate of regeneration in the deep shade of a primeval beech forest.
         European Journal of Forest Research, 141. https://doi.org/10.1007/s10342-021-01427-3
         """
+        return _survival_probability_table(age)
+
+    @staticmethod
+    def survival_probability_model(age):
+        """
+        Survival probability of an array of ages, see survival_probability
+        """
         alpha = 1  # Upper asymptote
         beta = 0.7  # Growth range
         rate = 0.05  # Growth rate
         slope = 0.9  # Slope of growth
         delta = 0.8  # Clip bottom values
 
-        survival_probability = 1 - (alpha * (1 - beta * np.exp(-rate * age)) ** (1 / (1 - slope)) * delta)
+        return 1 - (alpha * (1 - beta * np.exp(-rate * age)) ** (1 / (1 - slope)) * delta)
 
-        random_number = np.random.random()  # Generate a random number between 0 and 1
-
-        return random_number < survival_probability
 
-    def generate_random_seeds(self, lat_center, long_center, config, radius):
-        """
-        Generate random point within the seeding circle
-        Use polar coordinate for time efficiency
-        """
-        germinating_seed_amount = int(config.seed_amount_map[self._height_level] * 0.1) # Keep propotions
-
-        seed_points = []
-        EarthRadius = 6371000.0
-
-        for seed in range(germinating_seed_amount):
-            # Generate random angle
-            theta = random.uniform(0, 2 * math.pi)
-            # Generate a random radius within the specified circle
-            r = random.uniform(0, radius)
+class AgeTable:
+    """
+    Values of a function of the age computed once for every age (integer, from 0) and looked up afterwards,
+    the table grows when an older age is asked
+    """
 
-            # Convert polar coordinates to Cartesian coordinates
-            x = r * math.cos(theta)
-            y = r * math.sin(theta)
+    def __init__(self, function, size=256):
+        self._function = function
+        self._table = function(np.arange(size))
 
-            # Convert Cartesian coordinates to latitude and longitude
-            lat_final = math.degrees(math.asin(math.sin(math.radians(lat_center)) * math.cos(y / EarthRadius) +
-                                               math.cos(math.radians(lat_center)) * math.sin(y / EarthRadius)))
+    def __call__(self, age):
+        if isinstance(age, int):
+            if age >= len(self._table):
+                self._grow(age)
+            return self._table[age].item()
+        age = np.asarray(age)
+        if age.size and age.max() >= len(self._table):
+            self._grow(age.max())
+        values = self._table[age]
+        return values.item() if values.ndim == 0 else values
 
-            lon_final = math.degrees(math.radians(long_center) + x / EarthRadius) % 360
+    def _grow(self, age):
+        self._table = self._function(np.arange(max(2 * len(self._table), int(age) + 1)))
 
-            # Check if the generated point is within the bounding box
-            if (config.bounding_box[0][0] <= lat_final <= config.bounding_box[1][0] and
-                    config.bounding_box[0][1] <= lon_final <= config.bounding_box[1][1]):
-                seed_points.append(((lat_final, lon_final), self._species))
 
-        return seed_points
+_height_level_table = AgeTable(Tree.height_level_model)
+_survival_probability_table = AgeTable(Tree.survival_probability_model)
@@ -1,7 +1,8 @@
+import hashlib
 import json
-import math
-from math import radians, sin, cos, sqrt, atan2
+import os
 
+import numpy as np
 import pandas as pd
 
 """
@@ -10,6 +11,8 @@ This file contains utility functions for the simulation such a loading function
 
 # seed_amount = None
 
+EARTH_RADIUS = 6371000.0
+
 spreading_factor_map = {
     1: 1.5,
     2: 1.2,
@@ -27,42 +30,128 @@ spreading_factor_map = {
 
 def import_data(config):
     """
-    Load the initial data in a dataframe
+    Load the initial data in a dataframe with the columns lat, long, GRUPPE, BAUMHOEHE and ALTERab2023, indexed by
+    the tree id. Only the trees inside the bounding box are kept.
+    The preprocessed data is cached in data_path/cache/, keyed by the hash of the data and mapping files, so that only
+    the first run has to parse the csv
+    """
+    cache_path = config.data_path + "cache/population_" + ingest_key(config) + "/"
+    if os.path.isdir(cache_path):
+        columns = read_columns(cache_path)
+        return pd.DataFrame({name: np.array(columns[name]) for name in INGEST_COLUMNS},
+                            index=pd.Index(np.array(columns["id"]), name="id"))
+
+    df = parse_data(config)
+    tmp_path = cache_path.rstrip("/") + ".tmp/"
+    write_columns(tmp_path, {"id": df.index.to_numpy(), **{name: df[name].to_numpy() for name in INGEST_COLUMNS}})
+    os.replace(tmp_path, cache_path)
+    return df
+
+
+INGEST_COLUMNS = ["lat", "long", "GRUPPE", "BAUMHOEHE", "ALTERab2023"]
+
+
+def ingest_key(config):
+    """
+    Hash of everything the preprocessed data depends on
+    """
+    key = hashlib.sha256()
+    for file in [config.data_file, config.species_mapping_file]:
+        with open(config.data_path + file, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                key.update(chunk)
+    key.update(repr((config.bounding_box, INGEST_COLUMNS)).encode())
+    return key.hexdigest()[:16]
+
+
+def parse_data(config):
+    """
+    Read the csv keeping only the needed columns, parse the POINT(long lat) shapes in bulk, filter the trees on the
+    bounding box and map the groups to their species id
     """
-    df = pd.read_csv(config.data_path + config.data_file, sep=',', index_col=0)
+    data_file = config.data_path + config.data_file
+    index_column = pd.read_csv(data_file, sep=',', nrows=0).columns[0]
+    df = pd.read_csv(data_file, sep=',', index_col=0,
+                     usecols=[index_column, "SHAPE", "GRUPPE", "BAUMHOEHE", "ALTERab2023"])
+
+    location = df["SHAPE"].str.extract(r"\(\s*(\S+)\s+([^\s)]+)").astype(np.float64)
+    df["long"] = location[0].to_numpy()
+    df["lat"] = location[1].to_numpy()
+    inside = ((config.bounding_box[0][0] <= df["lat"]) & (df["lat"] <= config.bounding_box[1][0]) &
+              (config.bounding_box[0][1] <= df["long"]) & (df["long"] <= config.bounding_box[1][1]))
+    df = df.loc[inside, INGEST_COLUMNS]
 
     with open(config.data_path + config.species_mapping_file, 'r', encoding='utf-8') as f:
         species_mapping = json.load(f)
-    df = df.replace({"GRUPPE": species_mapping})
+    df["GRUPPE"] = df["GRUPPE"].map(species_mapping).fillna(df["GRUPPE"]).astype(np.int64)
+    df.index.name = "id"
     return df
 
 
-def run_simulation(population, config, visualize):
+def write_columns(path, columns):
+    """
+    Save each array of columns as path/<name>.npy
+    """
+    os.makedirs(path, exist_ok=True)
+    for name, column in columns.items():
+        np.save(os.path.join(path, name + ".npy"), np.ascontiguousarray(column))
+
+
+def read_columns(path, mmap_mode='r'):
+    """
+    Load every path/<name>.npy, memory-mapped by default
+    """
+    return {file[:-4]: np.load(os.path.join(path, file), mmap_mode=mmap_mode)
+            for file in sorted(os.listdir(path)) if file.endswith(".npy")}
+
+
+def run_simulation(population, config, visualize, start_year=0):
     """
     Main loop of the simulation
-    Runs the population updates and visualisation creation for every generation
+    Runs the population updates and visualisation creation for every generation (no visualisation if visualize is
+    None)
+    A checkpoint is saved every config.checkpoint_interval years, start_year resumes from one
+    The statistic (and the snapshots of the trees) are written every year with config.stream_output (see YearlyOutput)
     """
-    for year in range(config.simulation_duration):
-        visualize.create_visualisation_step(population, year, config.result_path)
+    from src.checkpoint import checkpoint_path, save_checkpoint
+    from src.output import YearlyOutput
+
+    output = YearlyOutput(config) if config.stream_output else None
+    if output is not None:
+        output.start(population)
+    for year in range(start_year, config.simulation_duration):
+        if visualize is not None:
+            visualize.create_visualisation_step(population, year, config.result_path)
         population.update_forest(config, year)
-    visualize.create_visualisation_step(population, config.simulation_duration, config.result_path)
+        if output is not None:
+            output.write_year(population)
+        if config.checkpoint_interval and (year + 1) % config.checkpoint_interval == 0:
+            save_checkpoint(population, checkpoint_path(config, year + 1), year + 1)
+    if visualize is not None:
+        visualize.create_visualisation_step(population, config.simulation_duration, config.result_path)
+    if output is not None:
+        output.close()
 
 
-def distance_between_coordinate(lat1, lon1, lat2, lon2):
+def offset_coordinates(lat, long, north, east):
     """
-    Calculate the distance between two coordiantes using haversine distance
-    :return: distance in meter
+    Move coordinates by a (north, east) offset in meters using the local tangent plane of the WGS84 ellipsoid
+    (meridional and prime vertical radii of curvature at the starting latitude). Works on numpy arrays.
+
+    Compared to Geodesic.WGS84.Direct at Vienna latitude the error is below 0.4 mm for the largest seeding
+    distance of the model (34 m/s wind * 1.8 spreading factor = 61 m), about 1 mm at 100 m and grows with the square
+    of the distance (about 10 cm at 1 km)
+    :return: (lat, long) in degrees
     """
-    earth_radius = 6371000.0
-    lat1_rad = radians(lat1)
-    lon1_rad = radians(lon1)
-    lat2_rad = radians(lat2)
-    lon2_rad = radians(lon2)
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    a = sin(dlat / 2) ** 2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon / 2) ** 2
-    c = 2 * atan2(sqrt(a), sqrt(1 - a))
-    return earth_radius * c
+    semi_major_axis = 6378137.0
+    flattening = 1 / 298.257223563
+    eccentricity2 = flattening * (2 - flattening)
+    lat_rad = np.radians(lat)
+    w = 1 - eccentricity2 * np.sin(lat_rad) ** 2
+    meridional_radius = semi_major_axis * (1 - eccentricity2) / w ** 1.5
+    normal_radius = semi_major_axis / np.sqrt(w)
+    return (lat + np.degrees(north / meridional_radius),
+            long + np.degrees(east / (normal_radius * np.cos(lat_rad))))
 
 
 def get_spreading_factor_from_species(species: int):
@@ -72,22 +161,11 @@ def get_spreading_factor_from_species(species: int):
     return spreading_factor_map[species]
 
 
-def box_around_lat_long(original_latitude, original_longitude, meters_difference):
+def get_spreading_factors_from_species(species):
     """
-    Return latitudes and logiture around a given coordinate using a simplifying estimation of
-    the convertion from degrees to meters
+    Vectorized getter function, species is an array
     """
-    # Simplified version where 1m = 1/111.11 in lat and 1m = 111.11*cos(lat) in long
-    diff_lon = 1 / (meters_difference * 111.11 * math.cos(math.radians(original_latitude)))
-    diff_lat = meters_difference / 111.11
-    latitude_down = original_latitude - diff_lat
-    latitude_up = original_latitude + diff_lat
-    longitude_left = original_longitude - diff_lon
-    longitude_right = original_longitude + diff_lon
-    return latitude_down, longitude_left, latitude_up, longitude_right
-
-
-def observe_data(df):
-    print(df.head(15))
-    print(df.describe())
-    print(df.info())
+    factors = np.zeros(max(spreading_factor_map) + 1)
+    for group, factor in spreading_factor_map.items():
+        factors[group] = factor
+    return factors[species]
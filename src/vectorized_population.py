@@ -0,0 +1,195 @@
+import numpy as np
+
+from src.forest import Forest
+from src.mortality import DeathSchedule
+from src.population import Population
+from src.projection import local_projection
+from src.seeding import disperse_seeds
+from src.tree import Tree
+from src.utils import *
+
+
+class VectorizedPopulation(Population):
+    """
+    Population engine keeping the trees as numpy columns (see Forest).
+    Aging, growth, mortality and the seeding inputs are computed for the whole population at once,
+    the trees are still reachable as Tree objects through views over the columns.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self._trees = Forest()
+        self._trees.population = self
+        self._trees_alive = self._trees.trees_alive
+        self._death_schedule = None  # DeathSchedule of the rows, with config.mortality "scheduled"
+
+    def populate(self, df, config):
+        """
+        Generate the initial population of trees
+        """
+        species = df["GRUPPE"].to_numpy(dtype=np.int64)
+        self.populate_from_columns({
+            "id": df.index.to_numpy(dtype=np.int64),
+            "lat": df["lat"].to_numpy(dtype=np.float64),
+            "long": df["long"].to_numpy(dtype=np.float64),
+            "species": species,
+            "age": df["ALTERab2023"].to_numpy(dtype=np.int64),
+            "height_level": df["BAUMHOEHE"].to_numpy(dtype=np.int64),
+            "spreading_factor": get_spreading_factors_from_species(species),
+        }, config)
+
+    def populate_from_columns(self, columns, config):
+        """
+        Generate the initial population from arrays, columns maps each Forest column (but alive) to an array, with
+        the positions as lat and long (as returned by columns), they are projected on the plane of the simulation
+        """
+        self._wind_strategy = config.wind_strategy
+        self.species_label_map = config.species_label_map
+        self._projection = local_projection(config.bounding_box)
+
+        columns = dict(columns)
+        north, east = self._projection.to_plane(columns.pop("lat"), columns.pop("long"))
+        # Assert initial trees are in the simulation environment
+        inside = self._projection.contains(north, east)
+        rows = self._trees.append(north=north[inside], east=east[inside],
+                                  **{name: column[inside] for name, column in columns.items()})
+        self.init_spatial_index(config)
+        self._spatial_index.insert_many(rows.tolist(), self._trees.north[rows], self._trees.east[rows])
+        if config.verbose:
+            print("Number of Trees Alive:", len(self._trees_alive))
+
+        self._tree_groups = list(set(self._trees.species.tolist()))
+        self._current_tree_id = max(self._current_tree_id, int(self._trees.id.max(initial=0)))
+        self.init_instrumentation(config)
+        forest = self._trees
+        self.init_lifecycle(config, forest.id, forest.north, forest.east, forest.species, forest.age)
+        if config.mortality == "scheduled":
+            self._death_schedule = DeathSchedule()
+            self._death_schedule.add(rows, self._year, forest.age[rows])
+        self.init_statistic(config, self._trees.species, self._trees.height_level)
+
+    def trees_columns(self):
+        """
+        Columns of every row of the forest, with the alive flag and the rows to reuse (used by the checkpoints)
+        """
+        columns = {name: getattr(self._trees, name) for name in Forest.columns}
+        columns["free_rows"] = self._trees.free_rows
+        if self._death_schedule is not None:
+            columns.update(self._death_schedule.columns())
+        return columns
+
+    def restore_trees(self, columns, config):
+        """
+        Rebuild the forest from the columns returned by trees_columns
+        """
+        self._projection = local_projection(config.bounding_box)
+        self._trees = Forest(capacity=max(len(columns["id"]), 1024))
+        self._trees.population = self
+        self._trees_alive = self._trees.trees_alive
+        rows = self._trees.append(**{name: columns[name] for name in Forest.columns if name != "alive"})
+        self._trees.kill(rows[~columns["alive"]])
+        self._trees.free_rows = columns["free_rows"]
+        if "scheduled_keys" in columns:
+            self._death_schedule = DeathSchedule.from_columns(columns)
+        self.init_spatial_index(config)
+        rows = self._trees.alive_rows()
+        self._spatial_index.insert_many(rows.tolist(), self._trees.north[rows], self._trees.east[rows])
+
+    def columns(self):
+        """
+        Columns of the living trees with their positions as lat and long, as accepted by populate_from_columns
+        """
+        rows = self._trees.alive_rows()
+        return self.lat_long_columns({name: getattr(self._trees, name)[rows] for name in Forest.columns
+                                      if name != "alive"})
+
+    def add_new_trees(self, norths, easts, species):
+        """
+        Create new trees (age 0) at the given positions and add them to the population
+        """
+        ids = np.arange(self._current_tree_id + 1, self._current_tree_id + 1 + len(norths))
+        self._current_tree_id += len(norths)
+        rows = self._trees.append(id=ids, north=norths, east=easts, species=species, age=0, height_level=0,
+                                  spreading_factor=get_spreading_factors_from_species(species))
+        self._spatial_index.insert_many(rows.tolist(), norths, easts)
+        self._stats.add(species)
+        self._lifecycle.births(self._year, ids, *self._projection.to_lat_long(norths, easts), species)
+        if self._death_schedule is not None:
+            self._death_schedule.add(rows, self._year, np.zeros(len(rows), dtype=np.int64))
+
+    def remove_trees(self, trees):
+        """
+        Kill trees, accepts TreeView objects or an array of rows
+        """
+        if not isinstance(trees, np.ndarray):
+            trees = np.array([tree._row for tree in trees], dtype=np.int64)
+        for row in trees.tolist():
+            self._spatial_index.remove(row)
+        forest = self._trees
+        self._stats.remove(forest.species[trees])
+        self._lifecycle.deaths(self._year, forest.id[trees],
+                               *self._projection.to_lat_long(forest.north[trees], forest.east[trees]),
+                               forest.species[trees])
+        forest.kill(trees)
+
+    def update_forest(self, config, year):
+        """
+        Main loop for population update, vectorized over the whole population
+        """
+        self._year = self._starting_year + year + 1
+        instrumentation = self._instrumentation
+        instrumentation.start_year()
+        wind_direction, wind_strength = self.draw_wind(config)
+
+        with instrumentation.phase("tree_update"):
+            rows = self.update_trees(self._trees.alive_rows())
+        if config.seed_chunk_size:
+            forest = self._trees
+            self.plant_seed_chunks(forest.north[rows], forest.east[rows], forest.species[rows],
+                                   forest.height_level[rows], forest.spreading_factor[rows], wind_direction,
+                                   wind_strength, config)
+        else:
+            with instrumentation.phase("seeding"):
+                seeds_north, seeds_east, seeds_species = self.generate_seeds(rows, config, wind_direction,
+                                                                             wind_strength)
+            self.plant_seeds(seeds_north, seeds_east, seeds_species, config)
+        self.update_trees_statistics((wind_direction, wind_strength))
+
+    def update_trees(self, rows):
+        """
+        Age the trees at the given rows, update their height level and evaluate their mortality
+        A dead tree can not be replace the year of its death
+
+        :return: rows of the trees still alive
+        """
+        forest = self._trees
+        ages = forest.age[rows] + 1
+        forest.age[rows] = ages
+        forest.height_level[rows] = Tree.compute_height_level(ages)
+
+        alive = self.eval_mortality(rows, ages)
+        self.remove_trees(rows[~alive])
+        rows = rows[alive]
+        self._stats.count_heights(forest.species[rows], forest.height_level[rows])
+        return rows
+
+    def eval_mortality(self, rows, ages):
+        """
+        Survival of the trees at the given rows once aged, drawn every year or looked up in the death schedule
+        :return: alive mask
+        """
+        if self._death_schedule is None:
+            return np.random.random(len(rows)) < Tree.survival_probability(ages)
+        return ~np.isin(rows, self._death_schedule.pop(self._year))
+
+    def generate_seeds(self, rows, config, wind_direction, wind_strength):
+        """
+        Seeds of the trees at the given rows, generated for all trees at once
+        :return: (north, east, species) arrays
+        """
+        forest = self._trees
+        wind_direction, wind_strength = self.tree_wind(config, forest.north[rows], forest.east[rows], wind_direction,
+                                                       wind_strength)
+        return disperse_seeds(forest.north[rows], forest.east[rows], forest.species[rows], forest.height_level[rows],
+                              forest.spreading_factor[rows], wind_direction, wind_strength, config,
+                              instrumentation=self._instrumentation if self._instrumentation.enabled else None)
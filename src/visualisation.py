@@ -1,9 +1,15 @@
+import math
 import os
 import warnings
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
 import geopandas as gpd
 import imageio.v2 as imageio
 import matplotlib.pyplot as plt
+import numpy as np
+from matplotlib.lines import Line2D
+from matplotlib.patches import Patch
 from shapely.geometry import Polygon, MultiPolygon
 
 
@@ -11,9 +17,16 @@ class Visualisation:
     """
     Visualisation class
     Deals with the maps and Gif
+    With config.render_workers > 0 the maps are rendered by worker processes while the simulation goes on, from
+    snapshots of the living trees; at most config.render_queue frames wait to be rendered.
+    Every frame is appended to the animation (result_path/gif/simulation.<config.animation_format>) as soon as it is
+    rendered, the step_<i>.png files are only written with config.save_steps.
+    With config.map_mode "density" the trees are binned in a raster instead of drawn one by one, for very large
+    populations.
     """
 
     def __init__(self, config):
+        self._config = config
         self.species_label_map = config.species_label_map
         self.species_label_map_reversed = {v: k for k, v in self.species_label_map.items()}
         self.bounding_box = config.bounding_box
@@ -21,6 +34,31 @@ class Visualisation:
         self.tree_size_visualization_max = config.tree_size_visualization_max
         self.tree_size_visualization_min = config.tree_size_visualization_min
 
+        # Figure and background geometry, created with the first frame and reused
+        self._fig = None
+        self._vienna = None
+        self._danube = None
+
+        # Density raster, config.density_resolution pixels along the longitude and square cells in meters
+        self.map_mode = config.map_mode
+        self.density_age_shading = config.density_age_shading
+        lat_span = self.bounding_box[1][0] - self.bounding_box[0][0]
+        long_span = (self.bounding_box[1][1] - self.bounding_box[0][1]) * math.cos(
+            math.radians((self.bounding_box[0][0] + self.bounding_box[1][0]) / 2))
+        self.density_shape = (max(1, round(config.density_resolution * lat_span / long_span)),
+                              config.density_resolution)
+
+        # Asynchronous rendering
+        self.render_workers = config.render_workers
+        self.render_queue = config.render_queue or 2 * config.render_workers
+        self._executor = None
+        self._pending = deque()
+
+        # Streamed animation
+        self.animation_format = config.animation_format
+        self.save_steps = config.save_steps
+        self._writer = None
+
     def set_group_color_mapping(self, col):
         """
         This function assert that each species has the same color over time even if some species
@@ -42,77 +80,191 @@ class Visualisation:
         assigned_colors = [self.group_color_mapping[x] for x in col]
         return assigned_colors
 
-    def create_tree_map(self, pop, year, save_path=None):
+    def map_species2color(self, species):
         """
-        Create and save a map with the trees
+        Vectorized map_col2color on an array of species ids
+        :return: (n, 4) array of RGBA colors
         """
-        warnings.filterwarnings('ignore', message='.*argument looks like a single numeric RGB*.', )
-        fig, ax = plt.subplots(figsize=(10, 8))
+        labels = {group: self.species_label_map.get(group, str(group)) for group in np.unique(species).tolist()}
+        lookup = np.zeros((max(labels, default=0) + 1, 4))
+        for group, label in labels.items():
+            lookup[group] = self.group_color_mapping[label]
+        return lookup[species]
 
-        plt.xlim(self.bounding_box[0][1], self.bounding_box[1][1])
-        plt.ylim(self.bounding_box[0][0], self.bounding_box[1][0])
-
-        x = [x._long for x in pop._trees_alive]
-        y = [y._lat for y in pop._trees_alive]
-        # circle size depends on the tree age
-        ages = [x._age for x in pop._trees_alive]
-        # Scale in 5 steps between 0 and 25 (Max size over 25)
-        scale = [int(self.tree_size_visualization_min + i * (self.tree_size_visualization_max - self.tree_size_visualization_min)/5) for i in range(5)]
-        dot_size = [scale[(x // 5)] for x in ages]
-        groups = [self.species_label_map.get(x._species, str(x._species)) for x in pop._trees_alive]
-        colors = self.map_col2color(groups)
-
-        plt.scatter(x=x, y=y, color=colors, alpha=0.75, linewidth=0, s=dot_size)
+    def init_tree_map(self):
+        """
+        Create the figure reused by every frame: the background (Vienna and Danube) is loaded and drawn once,
+        each frame only updates the tree scatter (or the density raster), the title and the legend
+        """
+        warnings.filterwarnings('ignore', message='.*argument looks like a single numeric RGB*.', )
+        self._fig, self._ax = plt.subplots(figsize=(10, 8))
+        ax = self._ax
 
-        # add custom legend
-        plt.fill([], [], c='lightblue', label='Danube')
-        for group in self.group_color_mapping:
-            if group in groups:
-                plt.scatter([], [], c=self.group_color_mapping[group], alpha=0.75, s=5, label=group)
+        ax.set_xlim(self.bounding_box[0][1], self.bounding_box[1][1])
+        ax.set_ylim(self.bounding_box[0][0], self.bounding_box[1][0])
 
-        # Add background (Vienna and Danube)
-        self.draw_danube()
-        self.draw_vienna()
+        if self.map_mode == "density":
+            self._raster = ax.imshow(np.ones(self.density_shape + (3,)), origin='lower', aspect='auto',
+                                     interpolation='nearest', zorder=0,
+                                     extent=(self.bounding_box[0][1], self.bounding_box[1][1],
+                                             self.bounding_box[0][0], self.bounding_box[1][0]))
+        else:
+            self._scatter = ax.scatter([], [], alpha=0.75, linewidth=0)
 
-        # Adjust legend position and marker size
-        plt.legend(loc='upper left', title="Group Labels", title_fontsize='12', markerscale=5)
+        # Add background (Vienna and Danube), on top of the trees
+        self.draw_danube(ax)
+        self.draw_vienna(ax)
 
         # Add a main title
-        plt.suptitle(f"Tree Population {year}", fontsize=20)
+        self._title = self._fig.suptitle("", fontsize=20)
+        self._legend_groups = None
 
         ax.set_xticks([])  # Remove x-axis ticks
         ax.set_yticks([])  # Remove y-axis ticks
 
+    def create_tree_map(self, pop, year, save_path=None):
+        """
+        Create and save a map with the trees
+        :return: the map as an RGB array
+        """
+        return self.draw_tree_map(pop.columns(), year, save_path)
+
+    def draw_tree_map(self, trees, year, save_path=None):
+        """
+        Create and save a map with the trees given as columns (lat, long, age and species arrays)
+        :return: the map as an RGB array
+        """
+        if self._fig is None:
+            self.init_tree_map()
+
+        species = trees["species"]
+        if self.map_mode == "density":
+            self._raster.set_data(self.density_raster(trees))
+        else:
+            # circle size depends on the tree age
+            # Scale in 5 steps between 0 and 25 (Max size over 25)
+            scale = np.array([int(self.tree_size_visualization_min + i * (self.tree_size_visualization_max - self.tree_size_visualization_min)/5) for i in range(5)])
+            dot_size = scale[np.minimum(trees["age"] // 5, len(scale) - 1)]
+
+            self._scatter.set_offsets(np.column_stack([trees["long"], trees["lat"]]))
+            self._scatter.set_sizes(dot_size)
+            self._scatter.set_facecolor(self.map_species2color(species))
+        self._title.set_text(f"Tree Population {year}")
+
+        # The legend only lists the groups present, rebuilt when they change
+        groups = {self.species_label_map.get(group, str(group)) for group in np.unique(species).tolist()}
+        if groups != self._legend_groups:
+            self._legend_groups = groups
+            self.draw_legend([group for group in self.group_color_mapping if group in groups])
+
+        # Render once, the same pixels go to the png and to the animation
+        self._fig.canvas.draw()
+        frame = np.asarray(self._fig.canvas.buffer_rgba())[..., :3].copy()
         if save_path is not None:
-            plt.savefig(save_path)
+            imageio.imwrite(save_path, frame)
         if self.show_plot_on_the_fly:
             plt.show()
-        plt.close()
+        return frame
 
-    def draw_vienna(self, file_path='../data/export.geojson'):
+    def density_raster(self, trees):
         """
-        Add Vienna boundaries
+        Bin the trees in the raster cells: the color of a cell is the mean of its trees group colors, weighted by
+        the amount of trees of each group, and its intensity grows with the log of the amount of trees.
+        With density_age_shading, cells of older trees are darker (5 age classes, as the dot sizes).
+        :return: RGB raster, white where there is no tree
         """
-        gdf = gpd.read_file(file_path)
-        coordinates = gdf.geometry.unary_union.exterior.xy
-        plt.plot(coordinates[0], coordinates[1], linewidth=1, color='black', label='Vienna')
+        rows, columns = self.density_shape
+        row = ((trees["lat"] - self.bounding_box[0][0]) / (self.bounding_box[1][0] - self.bounding_box[0][0]) * rows)
+        column = ((trees["long"] - self.bounding_box[0][1]) / (self.bounding_box[1][1] - self.bounding_box[0][1])
+                  * columns)
+        cell = (np.clip(row.astype(np.int64), 0, rows - 1) * columns +
+                np.clip(column.astype(np.int64), 0, columns - 1))
+
+        # Per group counts composited by their colors, as sums of the color channels over the trees of each cell
+        count = np.bincount(cell, minlength=rows * columns)
+        colors = self.map_species2color(trees["species"])[:, :3]
+        mean_color = np.stack([np.bincount(cell, weights=colors[:, channel], minlength=rows * columns)
+                               for channel in range(3)], axis=-1)
+        occupied = count > 0
+        mean_color[occupied] /= count[occupied, None]
 
-    def draw_danube(self, dir_path='../data/'):
+        intensity = np.log1p(count) / np.log1p(max(count.max(), 1))
+        if self.density_age_shading:
+            age_class = np.minimum(trees["age"] // 5, 4)
+            mean_age_class = np.bincount(cell, weights=age_class, minlength=rows * columns)
+            mean_age_class[occupied] /= count[occupied]
+            mean_color *= 1 - 0.5 * mean_age_class[:, None] / 4
+
+        raster = 1 - intensity[:, None] * (1 - mean_color)
+        return raster.reshape(rows, columns, 3)
+
+    def write_frame(self, frame, path):
         """
-        The danube visualisation
+        Append a frame to the animation, opened in path/gif/ with the first frame
         """
-        for file in os.listdir(dir_path):
-            if file.startswith('danube'):
-                gdf = gpd.read_file(dir_path + file)
-                obj = gdf['geometry'][0]
+        if self.animation_format is None:
+            return
+        if self._writer is None:
+            if not os.path.isdir(path + "gif/"):
+                os.mkdir(path + "gif/")
+            self._writer = animation_writer(path + f"gif/simulation.{self.animation_format}")
+        self._writer.append_data(frame)
 
-                if type(obj) == Polygon:
-                    x, y = obj.exterior.xy
-                    plt.fill(x, y, linewidth=1, color='lightblue')
-                elif type(obj) == MultiPolygon:
-                    for polygon in list(obj.geoms):
-                        x, y = polygon.exterior.xy
-                        plt.fill(x, y, linewidth=2, color='lightblue')
+    def close(self):
+        """
+        Wait for the frames being rendered, stop the render workers, finish the animation and close the figure reused
+        by the frames
+        """
+        while self._pending:
+            self.write_frame(*self._pending.popleft().result())
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self._fig is not None:
+            plt.close(self._fig)
+            self._fig = None
+
+    def draw_legend(self, groups):
+        """
+        Legend with the Danube, the given groups and Vienna
+        """
+        handles = [Patch(color='lightblue', label='Danube')]
+        handles += [Line2D([], [], linestyle='', marker='o', markersize=5 ** 0.5, color=self.group_color_mapping[group],
+                           alpha=0.75, label=group) for group in groups]
+        handles.append(Line2D([], [], linewidth=1, color='black', label='Vienna'))
+        # Adjust legend position and marker size
+        self._ax.legend(handles=handles, loc='upper left', title="Group Labels", title_fontsize='12', markerscale=5)
+
+    def draw_vienna(self, ax, file_path='../data/export.geojson'):
+        """
+        Add Vienna boundaries, the file is only read once
+        """
+        if self._vienna is None:
+            gdf = gpd.read_file(file_path)
+            self._vienna = gdf.geometry.unary_union.exterior.xy
+        ax.plot(self._vienna[0], self._vienna[1], linewidth=1, color='black', label='Vienna')
+
+    def draw_danube(self, ax, dir_path='../data/'):
+        """
+        The danube visualisation, the files are only read once
+        """
+        if self._danube is None:
+            self._danube = []
+            for file in os.listdir(dir_path):
+                if file.startswith('danube'):
+                    gdf = gpd.read_file(dir_path + file)
+                    obj = gdf['geometry'][0]
+
+                    if type(obj) == Polygon:
+                        self._danube.append((obj.exterior.xy, 1))
+                    elif type(obj) == MultiPolygon:
+                        for polygon in list(obj.geoms):
+                            self._danube.append((polygon.exterior.xy, 2))
+        for (x, y), linewidth in self._danube:
+            ax.fill(x, y, linewidth=linewidth, color='lightblue')
 
     def create_visualisation_step(self, pop, iteration, path='../results/'):
         """
@@ -120,19 +272,64 @@ class Visualisation:
         """
         if not os.path.isdir(path):
             os.mkdir(path)
-        self.create_tree_map(pop, pop._starting_year + iteration, save_path=path + f"step_{iteration}.png")
+        year = pop._starting_year + iteration
+        save_path = path + f"step_{iteration}.png" if self.save_steps else None
+        if not self.render_workers:
+            self.write_frame(self.create_tree_map(pop, year, save_path=save_path), path)
+            return
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.render_workers, initializer=init_render_worker,
+                                                 initargs=(self._config, self.group_color_mapping))
+        # Backpressure: wait for the oldest frame when too many are queued
+        while len(self._pending) >= self.render_queue:
+            self.write_frame(*self._pending.popleft().result())
+        columns = pop.columns()
+        snapshot = {name: columns[name] for name in ["lat", "long", "age", "species"]}
+        self._pending.append(self._executor.submit(render_tree_map, snapshot, year, save_path, path))
 
     def make_gif(self, img_path='../results/', output_path='../results/gif/'):
         """
-        Generate a gif with all the simulation steps
+        Generate a gif with all the simulation steps saved as png (the animation is already streamed during the
+        simulation, this rebuilds it from the files), the images are appended one at a time
         """
         if not os.path.isdir(output_path):
             os.mkdir(output_path)
         images_name = []
-        images = []
         for filename in os.listdir(img_path):
             if filename.endswith('.png') and filename.startswith('step'):
                 images_name.append((filename, int(filename.split('_')[1].split('.')[0])))
-        for image_file, order in sorted(images_name, key=lambda x: x[1]):
-            images.append(imageio.imread(img_path + image_file))
-        imageio.mimsave(output_path + 'simulation.gif', images, fps=2)
+        with animation_writer(output_path + 'simulation.gif') as writer:
+            for image_file, order in sorted(images_name, key=lambda x: x[1]):
+                writer.append_data(imageio.imread(img_path + image_file))
+
+
+def animation_writer(file):
+    """
+    Animation writer encoding every frame as soon as it is appended, at 2 frames per second: the legacy GIF-PIL
+    format for a gif (the default pillow plugin keeps all the frames until the writer is closed), ffmpeg for a mp4
+    """
+    if file.endswith(".gif"):
+        return imageio.get_writer(file, format="GIF-PIL", mode="I", duration=0.5)
+    return imageio.get_writer(file, fps=2)
+
+
+_worker_visualisation = None
+
+
+def init_render_worker(config, group_color_mapping):
+    """
+    Render worker initializer: one Visualisation (and figure) per worker process
+    """
+    global _worker_visualisation
+    _worker_visualisation = Visualisation(config)
+    _worker_visualisation.show_plot_on_the_fly = False
+    _worker_visualisation.group_color_mapping = group_color_mapping
+
+
+def render_tree_map(trees, year, save_path, path):
+    """
+    Render worker task: draw and save the map of a snapshot of the living trees
+    :return: (frame, path) for Visualisation.write_frame
+    """
+    return _worker_visualisation.draw_tree_map(trees, year, save_path), path
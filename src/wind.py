@@ -0,0 +1,92 @@
+import numpy as np
+
+from src.projection import local_projection
+
+"""
+Wind field: a wind direction and strength per cell of a grid over the bounding box and per simulated year, read from
+a memory-mapped .npy file (wind_strategy "field")
+"""
+
+_fields = {}  # path -> WindField, loaded once per process
+
+
+def wind_field(config):
+    """
+    Wind field of config.wind_field_file (in data_path), opened on the first call
+    """
+    path = config.data_path + config.wind_field_file
+    if path not in _fields:
+        _fields[path] = WindField(np.load(path, mmap_mode='r'), local_projection(config.bounding_box).bounds)
+    return _fields[path]
+
+
+def save_wind_field(path, directions, strengths):
+    """
+    Write a wind field file
+    :param directions: (years, rows, columns) wind directions in degrees (0 is North), row 0 is the southern edge of
+                       the bounding box and the last row its northern edge, column 0 its western edge and the last
+                       column its eastern edge
+    :param strengths: (years, rows, columns) wind strengths
+    """
+    np.save(path, np.stack([directions, strengths], axis=-1).astype(np.float32))
+
+
+class WindField:
+    """
+    Wind directions and strengths on the nodes of a regular grid spanning the bounding box, one grid per year, as a
+    (years, rows, columns, 2) array (see save_wind_field). Only the grid of the year asked is read from the file.
+    The simulation year n uses the grid n modulo the amount of years of the file.
+    """
+
+    def __init__(self, field, bounds):
+        """
+        :param bounds: ((south, west), (north, east)) of the bounding box in meters, see LocalProjection.bounds
+        """
+        if field.ndim != 4 or field.shape[3] != 2 or field.shape[1] < 2 or field.shape[2] < 2:
+            raise ValueError(f"A wind field is a (years, rows >= 2, columns >= 2, 2) array, not {field.shape}")
+        self._field = field
+        (self._north_min, self._east_min), (north_max, east_max) = bounds
+        self._rows, self._columns = field.shape[1:3]
+        self._row_height = (north_max - self._north_min) / (self._rows - 1)
+        self._column_width = (east_max - self._east_min) / (self._columns - 1)
+        self._year = None
+
+    def _load(self, year):
+        """
+        Nodes of the grid of the year as a (3, rows * columns) array
+        """
+        year = year % len(self._field)
+        if self._year != year:
+            grid = np.asarray(self._field[year], dtype=np.float64)
+            bearing = np.radians(grid[..., 0])
+            # North component of the unit direction, east component and strength of every node
+            self._nodes = np.stack([np.cos(bearing), np.sin(bearing), grid[..., 1]]).reshape(3, -1)
+            self._year = year
+        return self._nodes
+
+    def at(self, year, north, east):
+        """
+        Wind at the given positions, bilinear interpolation between the 4 nodes around each position (the positions
+        outside the bounding box get the wind of its edge). The directions are interpolated as unit vectors.
+        :param year: simulated year, from 0
+        :return: (wind direction in degrees, wind strength) arrays
+        """
+        nodes = self._load(year)
+        y = np.clip((np.asarray(north) - self._north_min) / self._row_height, 0, self._rows - 1)
+        x = np.clip((np.asarray(east) - self._east_min) / self._column_width, 0, self._columns - 1)
+        row = np.minimum(y.astype(np.int64), self._rows - 2)
+        column = np.minimum(x.astype(np.int64), self._columns - 2)
+        dy, dx = y - row, x - column
+        node = row * self._columns + column
+        corners = [(node, (1 - dx) * (1 - dy)), (node + 1, dx * (1 - dy)),
+                   (node + self._columns, (1 - dx) * dy), (node + self._columns + 1, dx * dy)]
+        north, east, strength = (sum(values.take(corner) * weight for corner, weight in corners) for values in nodes)
+        return np.degrees(np.arctan2(east, north)) % 360, strength
+
+    def summary(self, year):
+        """
+        Wind of the year over the whole grid (recorded in the statistic): (direction of the mean unit vector,
+        mean strength)
+        """
+        north, east, strength = self._load(year).mean(axis=1)
+        return float(np.degrees(np.arctan2(east, north)) % 360), float(strength)
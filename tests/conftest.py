@@ -0,0 +1,49 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+from src.synthetic import synthetic_forest
+
+"""
+Shared fixtures: a config with the attributes of src/config.py that does not need config.yaml nor the data files,
+and small synthetic forests
+"""
+
+VIENNA_BOUNDING_BOX = ((48.1, 16.18), (48.33, 16.58))
+SMALL_BOUNDING_BOX = ((48.2, 16.35), (48.21, 16.365))  # about 1.1 km x 1.1 km
+
+
+@pytest.fixture
+def make_config(tmp_path):
+    """
+    Factory of configs, the keyword arguments override the defaults
+    """
+    def make(**overrides):
+        config = SimpleNamespace(
+            seed=1, data_path=str(tmp_path) + "/", result_path=str(tmp_path) + "/results/", wind_strategy="random",
+            headless=True, engine="vectorized", workers=2, parallel_tiles=None, lifecycle_log=False,
+            height_histogram=False, checkpoint_interval=None, resume_from=None, render_workers=0, render_queue=None,
+            animation_format=None, save_steps=False, map_mode="scatter", instrumentation=False, profiler=None,
+            progress_bars=False, verbose=False, mortality="yearly", seed_chunk_size=None, habitat_mask=False,
+            habitat_resolution=10, wind_field_file=None, stream_output=False, snapshots=False,
+            snapshot_compression=True, tiles=False, simulation_duration=3, default_seeding_radius=30,
+            seed_living_space=10, bounding_box=SMALL_BOUNDING_BOX,
+            seed_amount_map={0: 0, 1: 10, 2: 40, 3: 80, 4: 150, 5: 250, 6: 400, 7: 600, 8: 800},
+            species_label_map={group: f"G{group}" for group in range(1, 12)})
+        for name, value in overrides.items():
+            setattr(config, name, value)
+        os.makedirs(config.result_path, exist_ok=True)
+        return config
+    return make
+
+
+def small_forest(config, n_trees=400, seed=0):
+    """
+    Synthetic forest over the bounding box of the config, sorted by position like the objects engine keeps it
+    """
+    df = synthetic_forest(n_trees, config.bounding_box, seed=seed)
+    return df.sort_values(["lat", "long"])
@@ -0,0 +1,85 @@
+import random
+
+import numpy as np
+
+from conftest import small_forest
+from src.checkpoint import load_checkpoint, save_checkpoint
+from src.population import Population
+from src.vectorized_population import VectorizedPopulation
+
+"""
+A simulation resumed from a checkpoint continues exactly like the uninterrupted run: same trees, statistic, wind and
+lifecycle log
+"""
+
+
+def start(population, config):
+    random.seed(config.seed)
+    np.random.seed(config.seed)
+    population.populate(small_forest(config), config)
+    return population
+
+
+def simulate(population, config, years):
+    for year in years:
+        population.update_forest(config, year)
+    population.close()
+    return population
+
+
+def assert_same_run(population, reference):
+    assert population._statistic.equals(reference._statistic)
+    assert population._wind_dir_strength == reference._wind_dir_strength
+    columns, reference_columns = population.trees_columns(), reference.trees_columns()
+    assert columns.keys() == reference_columns.keys()
+    for name in columns.keys() - {"scheduled_keys", "scheduled_years"}:
+        np.testing.assert_array_equal(columns[name], reference_columns[name], err_msg=name)
+    if "scheduled_keys" in columns:
+        assert schedule_by_year(columns) == schedule_by_year(reference_columns)
+
+
+def schedule_by_year(columns):
+    """
+    Keys of the death schedule for every year, in the order they are popped (the years of a restored schedule are
+    listed sorted)
+    """
+    keys, years = columns["scheduled_keys"], columns["scheduled_years"]
+    return {year: keys[years == year].tolist() for year in np.unique(years).tolist()}
+
+
+def resumed_run(engine, make_config, tmp_path, **overrides):
+    """
+    Uninterrupted run and run resumed from the checkpoint of year 2, both of 5 years
+    """
+    config = make_config(simulation_duration=5, **overrides)
+    reference = simulate(start(engine(), config), config, range(5))
+
+    config = make_config(simulation_duration=5, result_path=str(tmp_path) + "/resumed/", **overrides)
+    population = simulate(start(engine(), config), config, range(2))
+    save_checkpoint(population, str(tmp_path) + "/checkpoint/", 2)
+    # The random generators move on before the checkpoint is loaded
+    np.random.random(100)
+    random.random()
+    population, year = load_checkpoint(str(tmp_path) + "/checkpoint/", config)
+    return simulate(population, config, range(year, 5)), reference
+
+
+def test_vectorized_resume(make_config, tmp_path):
+    population, reference = resumed_run(VectorizedPopulation, make_config, tmp_path)
+    assert_same_run(population, reference)
+
+
+def test_scheduled_mortality_resume(make_config, tmp_path):
+    population, reference = resumed_run(VectorizedPopulation, make_config, tmp_path, mortality="scheduled")
+    assert_same_run(population, reference)
+
+
+def test_objects_resume(make_config, tmp_path):
+    population, reference = resumed_run(Population, make_config, tmp_path)
+    assert_same_run(population, reference)
+
+
+def test_lifecycle_log_resume(make_config, tmp_path):
+    population, reference = resumed_run(VectorizedPopulation, make_config, tmp_path, lifecycle_log=True)
+    assert population._lifecycle.index == reference._lifecycle.index
+    np.testing.assert_array_equal(population._lifecycle.events(), reference._lifecycle.events())
@@ -0,0 +1,57 @@
+import numpy as np
+
+from src.mortality import DeathSchedule
+from src.tree import Tree
+
+"""
+Scheduled mortality: the ages of death drawn once follow the same distribution as the yearly survival draws
+"""
+
+
+def yearly_death_ages(ages, rng):
+    """
+    Reference: every year each living tree gets one year older and survives with Tree.survival_probability
+    """
+    ages = ages.copy()
+    death_ages = np.zeros(len(ages), dtype=np.int64)
+    alive = np.ones(len(ages), dtype=bool)
+    while alive.any():
+        ages[alive] += 1
+        dies = alive.copy()
+        dies[alive] = rng.random(np.count_nonzero(alive)) >= Tree.survival_probability(ages[alive])
+        death_ages[dies] = ages[dies]
+        alive &= ~dies
+    return death_ages
+
+
+def test_death_ages_follow_the_yearly_draws():
+    amount = 200000
+    for age in (0, 20, 60):
+        ages = np.full(amount, age)
+        scheduled = DeathSchedule().sample_death_ages(ages, 1 - np.random.default_rng(age).random(amount))
+        yearly = yearly_death_ages(ages, np.random.default_rng(age + 1))
+        assert (scheduled > age).all()
+        assert abs(scheduled.mean() - yearly.mean()) < 0.02 * yearly.mean()
+        # Probability of dying at each age, compared where it is large enough to be estimated
+        scheduled_histogram = np.bincount(scheduled, minlength=300)[:300] / amount
+        yearly_histogram = np.bincount(yearly, minlength=300)[:300] / amount
+        np.testing.assert_allclose(scheduled_histogram, yearly_histogram, atol=0.005)
+
+
+def test_first_year_death_probability():
+    ages = np.full(100000, 40)
+    scheduled = DeathSchedule().sample_death_ages(ages, 1 - np.random.default_rng(0).random(len(ages)))
+    expected = 1 - Tree.survival_probability(np.array([41]))[0]
+    assert abs(np.mean(scheduled == 41) - expected) < 0.01
+
+
+def test_pop_and_columns():
+    schedule = DeathSchedule()
+    rng = np.random.default_rng(0)
+    schedule.add(np.arange(1000), 2023, rng.integers(0, 100, 1000), random_state=rng)
+    restored = DeathSchedule.from_columns(schedule.columns())
+    dead = [schedule.pop(year) for year in range(2023, 2023 + 1000)]
+    assert sorted(np.concatenate(dead).tolist()) == list(range(1000))
+    assert len(schedule.pop(2024)) == 0
+    for year, keys in zip(range(2023, 2023 + 1000), dead):
+        assert sorted(restored.pop(year).tolist()) == sorted(keys.tolist())
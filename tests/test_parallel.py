@@ -0,0 +1,43 @@
+import random
+
+import numpy as np
+
+from conftest import small_forest
+from src.parallel_population import ParallelPopulation
+
+"""
+The parallel engine draws from one random stream per tile and year, a run only depends on the seed and the tile
+layout, not on the amount of workers nor on their scheduling
+"""
+
+
+def run(config, workers, tiles):
+    random.seed(config.seed)
+    np.random.seed(config.seed)
+    population = ParallelPopulation(workers=workers, tiles=tiles)
+    try:
+        population.populate(small_forest(config, n_trees=600), config)
+        for year in range(config.simulation_duration):
+            population.update_forest(config, year)
+    finally:
+        population.close()
+    return population
+
+
+def test_same_run_for_any_amount_of_workers(make_config):
+    config = make_config(engine="parallel")
+    reference = run(config, 1, (2, 2))
+    for workers in (2, 3):
+        population = run(config, workers, (2, 2))
+        assert population._statistic.equals(reference._statistic)
+        forest, reference_forest = population._trees, reference._trees
+        rows, reference_rows = forest.alive_rows(), reference_forest.alive_rows()
+        np.testing.assert_array_equal(forest.north[rows], reference_forest.north[reference_rows])
+        np.testing.assert_array_equal(forest.age[rows], reference_forest.age[reference_rows])
+
+
+def test_tile_layout_changes_the_run_only_statistically(make_config):
+    config = make_config(engine="parallel")
+    sizes = run(config, 2, (1, 2))._statistic["population_size"].to_numpy()
+    other_sizes = run(config, 2, (2, 2))._statistic["population_size"].to_numpy()
+    np.testing.assert_allclose(other_sizes, sizes, rtol=0.1)
@@ -0,0 +1,86 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np
+from geographiclib.geodesic import Geodesic
+
+from src.projection import local_projection
+
+"""
+Accuracy of the local projection of the simulation over the Vienna bounding box, compared to the WGS84 geodesic
+distances
+"""
+
+VIENNA_BOUNDING_BOX = ((48.1, 16.18), (48.33, 16.58))
+DISTANCE_BOUND = 0.0023  # relative, documented in LocalProjection
+
+
+def random_positions(amount, seed=0):
+    """
+    Latitudes and longitudes drawn uniformly in the bounding box
+    """
+    (lat_min, long_min), (lat_max, long_max) = VIENNA_BOUNDING_BOX
+    rng = np.random.default_rng(seed)
+    return rng.uniform(lat_min, lat_max, amount), rng.uniform(long_min, long_max, amount)
+
+
+def plane_distance_errors(lats, longs, azimuths, distance):
+    """
+    Relative errors of the distances on the plane between the positions and the points at the geodesic distance in
+    the given azimuths
+    """
+    projection = local_projection(VIENNA_BOUNDING_BOX)
+    errors = []
+    for lat, long, azimuth in zip(lats, longs, azimuths):
+        destination = Geodesic.WGS84.Direct(lat, long, azimuth, distance)
+        north1, east1 = projection.to_plane(lat, long)
+        north2, east2 = projection.to_plane(destination["lat2"], destination["lon2"])
+        errors.append(abs(np.hypot(north2 - north1, east2 - east1) - distance) / distance)
+    return np.array(errors)
+
+
+def test_distances_within_bound_across_the_box():
+    lats, longs = random_positions(2000)
+    azimuths = np.random.default_rng(1).uniform(0, 360, len(lats))
+    for distance in (10, 120, 1000):
+        assert plane_distance_errors(lats, longs, azimuths, distance).max() <= DISTANCE_BOUND
+
+
+def test_distances_within_bound_at_the_edges():
+    """
+    The east-west distances are the furthest off at the northern and southern edges of the box
+    """
+    (lat_min, long_min), (lat_max, long_max) = VIENNA_BOUNDING_BOX
+    azimuths = np.arange(0, 360, 15)
+    for lat in (lat_min, lat_max):
+        for long in (long_min, long_max):
+            errors = plane_distance_errors(np.full(len(azimuths), lat), np.full(len(azimuths), long), azimuths, 120)
+            assert errors.max() <= DISTANCE_BOUND
+
+
+def test_north_south_distances():
+    (lat_min, _), (lat_max, _) = VIENNA_BOUNDING_BOX
+    errors = plane_distance_errors([lat_min, lat_max, lat_min, lat_max], [16.38] * 4, [0, 0, 180, 180], 1000)
+    assert errors.max() <= 3e-5
+
+
+def test_round_trip():
+    projection = local_projection(VIENNA_BOUNDING_BOX)
+    lats, longs = random_positions(100000)
+    round_trip_lats, round_trip_longs = projection.to_lat_long(*projection.to_plane(lats, longs))
+    np.testing.assert_allclose(round_trip_lats, lats, rtol=0, atol=1e-12)
+    np.testing.assert_allclose(round_trip_longs, longs, rtol=0, atol=1e-12)
+    north, east = projection.to_plane(lats, longs)
+    np.testing.assert_allclose(projection.to_plane(*projection.to_lat_long(north, east)), (north, east), rtol=0,
+                               atol=1e-6)
+
+
+def test_bounds_contain_the_box():
+    projection = local_projection(VIENNA_BOUNDING_BOX)
+    lats, longs = random_positions(1000)
+    assert projection.contains(*projection.to_plane(lats, longs)).all()
+    (lat_min, long_min), (lat_max, long_max) = VIENNA_BOUNDING_BOX
+    assert not projection.contains(*projection.to_plane(lat_max + 0.001, long_min))
+    assert not projection.contains(*projection.to_plane(lat_min, long_max + 0.001))
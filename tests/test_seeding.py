@@ -0,0 +1,119 @@
+import random
+
+import numpy as np
+
+from conftest import small_forest
+from src.seeding import germinate_seed_chunks, seed_amount_per_height_level, seed_chunks, select_germinating_seeds
+from src.spatial_index import GridIndex
+from src.utils import get_spreading_factors_from_species
+from src.vectorized_population import VectorizedPopulation
+
+"""
+Germination of the seeds: first come first served in a random order, against the living trees and the seeds accepted
+before, with the seeds of the year all at once or streamed in chunks
+"""
+
+
+def random_seeds(amount, seed):
+    rng = np.random.default_rng(seed)
+    return rng.uniform(0, 200, amount), rng.uniform(0, 200, amount), rng.integers(1, 12, amount)
+
+
+def sequential_germination(seeds_north, seeds_east, seeds_species, trees_north, trees_east, order, config):
+    """
+    Reference: the seeds are tried one by one in order against every tree and every accepted seed
+    """
+    radii = config.seed_living_space + get_spreading_factors_from_species(seeds_species)
+    occupied_north, occupied_east = list(trees_north), list(trees_east)
+    accepted = []
+    for i in order:
+        distances = np.hypot(np.array(occupied_north) - seeds_north[i], np.array(occupied_east) - seeds_east[i])
+        # The trees block the seeds closer than their radius, the accepted seeds too
+        if not (distances < radii[i]).any():
+            occupied_north.append(seeds_north[i])
+            occupied_east.append(seeds_east[i])
+            accepted.append(i)
+    return accepted
+
+
+def test_first_come_first_served(make_config):
+    config = make_config()
+    seeds_north, seeds_east, seeds_species = random_seeds(3000, 0)
+    rng = np.random.default_rng(1)
+    trees_north, trees_east = rng.uniform(0, 200, (2, 150))
+    trees_index = GridIndex(config.seed_living_space + 2)
+    trees_index.insert_many(range(150), trees_north, trees_east)
+
+    accepted = select_germinating_seeds(seeds_north, seeds_east, seeds_species, trees_index, config,
+                                        rng=np.random.default_rng(2))
+    order = np.random.default_rng(2).permutation(len(seeds_north))
+    expected = sequential_germination(seeds_north, seeds_east, seeds_species, trees_north, trees_east, order, config)
+    np.testing.assert_array_equal(accepted, expected)
+    assert len(trees_index) == 150  # The accepted seeds are not added to the index of the trees
+
+
+def test_accepted_seeds_keep_their_living_space(make_config):
+    config = make_config()
+    seeds_north, seeds_east, seeds_species = random_seeds(2000, 3)
+    accepted = select_germinating_seeds(seeds_north, seeds_east, seeds_species, GridIndex(12.0), config,
+                                        rng=np.random.default_rng(4))
+    radii = config.seed_living_space + get_spreading_factors_from_species(seeds_species)
+    for position, i in enumerate(accepted):
+        before = accepted[:position]
+        distances = np.hypot(seeds_north[before] - seeds_north[i], seeds_east[before] - seeds_east[i])
+        assert (distances >= radii[i]).all()
+
+
+def test_chunks_generate_every_seed(make_config):
+    config = make_config()
+    rng = np.random.default_rng(0)
+    # Trees around the center of the bounding box, all their seeds fall inside
+    amount = 300
+    north, east = rng.uniform(-200, 200, (2, amount))
+    species = rng.integers(1, 12, amount)
+    height_level = rng.integers(0, 9, amount)
+    spreading_factor = get_spreading_factors_from_species(species)
+    chunks = list(seed_chunks(north, east, species, height_level, spreading_factor, 45.0, 10.0, config, 500,
+                              rng=np.random.default_rng(1)))
+    expected = int(seed_amount_per_height_level(config)[height_level].sum())
+    assert len(chunks) == -(-expected // 500)
+    assert sum(generated for generated, _ in chunks) == expected
+    assert sum(len(seeds[0]) for _, seeds in chunks) == expected
+    seeds_species = np.concatenate([seeds[2] for _, seeds in chunks])
+    np.testing.assert_array_equal(np.bincount(seeds_species, minlength=12),
+                                  np.bincount(species, weights=seed_amount_per_height_level(config)[height_level],
+                                              minlength=12))
+
+
+def test_chunked_germination_matches_one_pass(make_config):
+    config = make_config()
+    seeds_north, seeds_east, seeds_species = random_seeds(3000, 5)
+    rng = np.random.default_rng(6)
+    trees_north, trees_east = rng.uniform(0, 200, (2, 150))
+    trees_index = GridIndex(config.seed_living_space + 2)
+    trees_index.insert_many(range(150), trees_north, trees_east)
+
+    # The chunks are already in random order, the seeds are accepted in the order of the chunks
+    bounds = [0, 700, 1400, 2100, 3000]
+    chunks = [(end - start, (seeds_north[start:end], seeds_east[start:end], seeds_species[start:end]))
+              for start, end in zip(bounds, bounds[1:])]
+    north, east, species = germinate_seed_chunks(chunks, trees_index, config)
+    expected = sequential_germination(seeds_north, seeds_east, seeds_species, trees_north, trees_east,
+                                      range(len(seeds_north)), config)
+    np.testing.assert_array_equal(north, seeds_north[expected])
+    np.testing.assert_array_equal(east, seeds_east[expected])
+    np.testing.assert_array_equal(species, seeds_species[expected])
+
+
+def test_chunked_population_close_to_one_pass(make_config):
+    sizes = {}
+    for chunk_size in (None, 2000):
+        config = make_config(seed_chunk_size=chunk_size)
+        random.seed(config.seed)
+        np.random.seed(config.seed)
+        population = VectorizedPopulation()
+        population.populate(small_forest(config), config)
+        for year in range(config.simulation_duration):
+            population.update_forest(config, year)
+        sizes[chunk_size] = population._statistic["population_size"].to_numpy()
+    np.testing.assert_allclose(sizes[2000], sizes[None], rtol=0.1)
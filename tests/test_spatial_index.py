@@ -0,0 +1,68 @@
+import numpy as np
+
+from src.spatial_index import GridIndex
+
+"""
+Neighbour queries of the grid index compared to a brute force search
+"""
+
+
+def random_index(amount=2000, extent=300.0, cell_size=20.0, seed=0):
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform(-extent, extent, (amount, 2))
+    index = GridIndex(cell_size)
+    index.insert_many(range(amount), positions[:, 0], positions[:, 1])
+    return index, positions
+
+
+def brute_force_any_within(positions, north, east, radius):
+    return bool((((positions[:, 0] - north) ** 2 + (positions[:, 1] - east) ** 2) < radius ** 2).any())
+
+
+def test_any_within_matches_brute_force():
+    index, positions = random_index()
+    rng = np.random.default_rng(1)
+    # Radii below, at and above the cell size
+    for north, east, radius in zip(rng.uniform(-320, 320, 500), rng.uniform(-320, 320, 500),
+                                   rng.choice([1.0, 8.0, 20.0, 45.0], 500)):
+        assert index.any_within(north, east, radius) == brute_force_any_within(positions, north, east, radius)
+
+
+def test_any_within_many_matches_any_within():
+    index, positions = random_index()
+    rng = np.random.default_rng(2)
+    norths, easts = rng.uniform(-320, 320, (2, 2000))
+    radii = rng.uniform(1, 45, 2000)
+    expected = [brute_force_any_within(positions, north, east, radius)
+                for north, east, radius in zip(norths, easts, radii)]
+    np.testing.assert_array_equal(index.any_within_many(norths, easts, radii), expected)
+
+
+def test_candidates_contain_every_neighbour():
+    index, positions = random_index()
+    rng = np.random.default_rng(3)
+    for north, east, radius in zip(rng.uniform(-300, 300, 200), rng.uniform(-300, 300, 200), rng.uniform(1, 60, 200)):
+        neighbours = np.flatnonzero(((positions[:, 0] - north) ** 2 + (positions[:, 1] - east) ** 2) <= radius ** 2)
+        assert set(neighbours.tolist()) <= set(index.candidates(north, east, radius))
+
+
+def test_remove():
+    index, positions = random_index(amount=200)
+    for key in range(0, 200, 2):
+        index.remove(key)
+    assert len(index) == 100
+    kept = positions[1::2]
+    for north, east in positions[::2]:
+        assert index.any_within(north, east, 15.0) == brute_force_any_within(kept, north, east, 15.0)
+    assert not index.any_within_many(np.array([1e4]), np.array([1e4]), 10.0).any()
+
+
+def test_points_across_cell_borders():
+    index = GridIndex(10.0)
+    index.insert("a", -0.001, -10.0)
+    index.insert("b", 10.0, 0.0)
+    # Neighbours in the adjacent cells, with negative coordinates
+    assert index.any_within(0.0, -9.995, 0.01)
+    assert index.any_within(9.999, 0.0, 0.01)
+    assert not index.any_within(0.0, 0.0, 9.99)
+    assert index.any_within(0.0, 0.0, 10.01)